@@ -0,0 +1,208 @@
+import asyncio
+import os
+import socket
+import tempfile
+from collections import Counter
+from hashlib import md5
+from urllib.parse import urlparse
+from bing_getImg_murl import (DOWNLOAD_CHUNK_SIZE, IMAGE_HEADERS, IMAGE_TIMEOUT, MIN_TRANSFER_RATE, SNIFF_BYTES,
+                              finish_download, link_known_url, sniff_image_type)
+from net_utils import (CIRCUIT_OPEN, CONNECT_TIMEOUT, CONNECTION_ERROR, DNS_ERROR, DOWNLOAD_OK, NOT_IMAGE, OTHER_ERROR,
+                       READ_TIMEOUT, SLOW_TRANSFER, TRUNCATED, USER_AGENT, HostCircuitBreaker, HostRateLimiter,
+                       NotAnImageError, RetryPolicy, SlowTransferError, TransferWatchdog, classify_status)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def classify_client_error(exc):
+    """把 aiohttp 抛出的异常归类为 net_utils 中的失败类型"""
+    if isinstance(exc, SlowTransferError):
+        return SLOW_TRANSFER
+    if isinstance(exc, NotAnImageError):
+        return NOT_IMAGE
+    # ConnectionTimeoutError 在 aiohttp 3.10 之后才有，旧版本的连接超时按读取超时处理
+    connect_timeout = getattr(aiohttp, 'ConnectionTimeoutError', None)
+    if connect_timeout is not None and isinstance(exc, connect_timeout):
+        return CONNECT_TIMEOUT
+    if isinstance(exc, asyncio.TimeoutError):
+        return READ_TIMEOUT
+    if isinstance(exc, aiohttp.ClientPayloadError):
+        return TRUNCATED
+    if isinstance(exc, aiohttp.ClientConnectorError):
+        return DNS_ERROR if isinstance(exc.os_error, socket.gaierror) else CONNECTION_ERROR
+    if isinstance(exc, (aiohttp.ClientConnectionError, ConnectionError)):
+        return CONNECTION_ERROR
+    return OTHER_ERROR
+
+
+async def wait_for_limiter(limiter, url):
+    """不阻塞事件循环地等待限速器放行"""
+    while True:
+        sleep_time = limiter.reserve(url)
+        if not sleep_time:
+            return
+        await asyncio.sleep(sleep_time)
+
+
+async def fetch_image_async(session, url, save_dir, store=None, limiter=None):
+    """请求并保存一次图片，返回 (结果, 说明)，与 fetch_image 相同"""
+    try:
+        async with session.get(url, headers=IMAGE_HEADERS) as response:
+            if limiter is not None:
+                limiter.observe_status(url, response.status, response.headers.get('Retry-After'))
+            outcome = classify_status(response.status)
+            if outcome != DOWNLOAD_OK:
+                return outcome, f"状态码 {response.status}"
+
+            # 先读够文件头判断格式，非图片内容不写入磁盘；读文件头时也检查传输速率
+            watchdog = TransferWatchdog(MIN_TRANSFER_RATE)
+            head = b''
+            while len(head) < SNIFF_BYTES and not response.content.at_eof():
+                chunk = await response.content.read(DOWNLOAD_CHUNK_SIZE)
+                head += chunk
+                watchdog.update(len(chunk))
+            ext = sniff_image_type(head, response.headers.get('Content-Type'))
+
+            # 流式写入，内存中只保留一个分块，文件名为内容的MD5
+            digest = md5()
+            fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=store.tmp_dir if store else save_dir)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    digest.update(head)
+                    f.write(head)
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        watchdog.update(len(chunk))
+                file_name, saved = finish_download(tmp_path, digest.hexdigest(), ext, save_dir, store, url)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            if saved:
+                print(f"成功保存: {file_name}")
+            else:
+                print(f"图片已存在，跳过: {file_name}")
+            return DOWNLOAD_OK, file_name
+
+    except Exception as e:
+        return classify_client_error(e), str(e) or type(e).__name__
+
+
+async def download_image_async(session, url, save_dir, store=None, limiter=None, retry=None, breaker=None):
+    """download_image 的异步版本：下载单张图片并使用MD5去重，返回最终结果（DOWNLOAD_OK 或失败类型）"""
+    if retry is None:
+        retry = RetryPolicy()
+    # 发请求前先查URL索引，下载过的图片直接关联到词条目录
+    if store is not None and link_known_url(url, save_dir, store):
+        return DOWNLOAD_OK
+
+    attempt = 1
+    while True:
+        if breaker is not None and not breaker.allow(url):
+            outcome, detail = CIRCUIT_OPEN, "域名熔断中"
+            break
+        outcome, detail = await fetch_image_async(session, url, save_dir, store, limiter)
+        if breaker is not None:
+            breaker.record(url, outcome)
+        if outcome == DOWNLOAD_OK or not retry.should_retry(outcome, attempt):
+            break
+        pause = retry.delay(attempt)
+        print(f"下载出错（{outcome}: {detail}），{pause:.1f} 秒后第 {attempt + 1} 次尝试: {url}")
+        await asyncio.sleep(pause)
+        if limiter is not None:
+            await wait_for_limiter(limiter, url)
+        attempt += 1
+
+    if outcome != DOWNLOAD_OK:
+        print(f"下载失败（{outcome}: {detail}，共尝试 {attempt} 次）: {url}")
+    return outcome
+
+
+async def _download_all(img_urls, save_dir, max_images, workers, per_host, store, on_result, limiter, retry,
+                        breaker):
+    outcomes = Counter()
+    host_slots = {}
+    total = len(img_urls) if hasattr(img_urls, '__len__') else '?'
+
+    async def worker(i, img_url):
+        if store is not None and store.lookup_url(img_url):
+            # 已下载过的URL不发请求，不占用域名并发和限速额度
+            return await download_image_async(session, img_url, save_dir, store=store)
+        if breaker.is_open(img_url):
+            return CIRCUIT_OPEN
+        host = urlparse(img_url).netloc
+        if host not in host_slots:
+            host_slots[host] = asyncio.Semaphore(per_host)
+        async with host_slots[host]:
+            await wait_for_limiter(limiter, img_url)
+            print(f"\n下载第 {i}/{total} 张原图: {img_url}")
+            return await download_image_async(session, img_url, save_dir, store=store, limiter=limiter,
+                                              retry=retry, breaker=breaker)
+
+    def collect(done):
+        count = 0
+        for task in done:
+            outcome = task.result()
+            outcomes[outcome] += 1
+            if on_result:
+                on_result(task_urls.pop(task), outcome)
+            count += 1 if outcome == DOWNLOAD_OK else 0
+        return count
+
+    downloaded_count = 0
+    pending = set()
+    task_urls = {}
+    connector = aiohttp.TCPConnector(limit=workers, limit_per_host=per_host)
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=IMAGE_TIMEOUT[0], sock_read=IMAGE_TIMEOUT[1])
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers={"User-Agent": USER_AGENT}) as session:
+        iterator = iter(img_urls)
+        i = 0
+        while True:
+            if hasattr(img_urls, '__len__'):
+                img_url = next(iterator, None)
+            else:
+                # 边滚动边提取的URL生成器会阻塞，放到线程中取下一个，不阻塞事件循环里的下载
+                img_url = await asyncio.get_running_loop().run_in_executor(None, next, iterator, None)
+            if img_url is None:
+                break
+            i += 1
+            # 同时进行的任务已满，或在途任务全部成功就会达到上限时，先等一个任务结束，避免多下载
+            while pending and (len(pending) >= workers or
+                               (max_images and downloaded_count + len(pending) >= max_images)):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                downloaded_count += collect(done)
+            if max_images and downloaded_count >= max_images:
+                print(f"已达到最大下载数 {max_images}，停止下载")
+                break
+            task = asyncio.ensure_future(worker(i, img_url))
+            task_urls[task] = img_url
+            pending.add(task)
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            downloaded_count += collect(done)
+
+    failed = {outcome: count for outcome, count in outcomes.items() if outcome != DOWNLOAD_OK}
+    if failed:
+        print(f"下载失败统计（临时性错误已重试）：{failed}")
+    return downloaded_count
+
+
+def download_images_async(img_urls, save_dir, max_images=None, workers=64, per_host=4, delay=0, store=None,
+                          on_result=None, limiter=None, retry=None, breaker=None):
+    """用 asyncio + aiohttp 在单个线程内并发下载原图，参数和返回值与 download_images_concurrently 相同"""
+    # workers：同时进行的下载数，不受线程数限制，可以设得比线程池大很多（例如几十到几百）
+    # 需要安装 aiohttp；不能在已经运行事件循环的线程中调用
+    if aiohttp is None:
+        raise ImportError("异步下载需要安装 aiohttp：pip install aiohttp")
+    if limiter is None:
+        limiter = HostRateLimiter(qps=1 / delay if delay else None, burst=per_host)
+    if breaker is None:
+        breaker = HostCircuitBreaker()
+    return asyncio.run(_download_all(img_urls, save_dir, max_images, workers, per_host, store, on_result, limiter,
+                                     retry, breaker))
@@ -0,0 +1,93 @@
+import argparse
+import multiprocessing
+import os
+import struct
+import tempfile
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from bing_getImg_murl import download_images_concurrently
+from net_utils import create_session
+
+
+def synthetic_png(index, size):
+    """生成一张内容各不相同的PNG（只保证文件头和尺寸字段正确，用于下载测试）"""
+    header = b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 800, 600)
+    body = index.to_bytes(8, 'big') + os.urandom(max(size - len(header) - 8, 0))
+    return header + body + struct.pack('>I', zlib.crc32(body))
+
+
+class SyntheticImageHandler(BaseHTTPRequestHandler):
+    """/img/<编号>.png 返回合成图片，每个请求先等待 latency 秒模拟慢速源站"""
+    protocol_version = "HTTP/1.1"
+    latency = 0.1
+    size = 50 * 1024
+    images = {}
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        index = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+        body = self.images.setdefault(index, synthetic_png(index, self.size))
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(latency, size, port_queue):
+    handler = type('Handler', (SyntheticImageHandler,), {'latency': latency, 'size': size, 'images': {}})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def start_server(latency, size):
+    """在单独的进程中启动合成图片服务器（避免与被测的下载线程争用GIL），返回 (进程, 端口)"""
+    port_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(latency, size, port_queue), daemon=True)
+    process.start()
+    return process, port_queue.get()
+
+
+def run_backend(backend, urls, workers):
+    """用指定方式下载全部URL到临时目录，返回 (成功数量, 用时)"""
+    save_dir = tempfile.mkdtemp(prefix=f"bench_{backend}_")
+    start = time.monotonic()
+    if backend == "asyncio":
+        from async_downloader import download_images_async
+        count = download_images_async(urls, save_dir, workers=workers, per_host=workers)
+    else:
+        # 连接池大小与线程数一致，避免线程等待连接
+        session = create_session(pool_maxsize=workers)
+        count = download_images_concurrently(urls, save_dir, workers=workers, per_host=workers, session=session)
+    return count, time.monotonic() - start
+
+
+if __name__ == "__main__":
+    # 用法：python bench_download.py --count 2000 --latency 0.2 --workers 64
+    parser = argparse.ArgumentParser(description="在本地合成图片服务器上比较线程池和 asyncio 两种下载方式")
+    parser.add_argument("--count", type=int, default=500, help="图片数量")
+    parser.add_argument("--latency", type=float, default=0.1, help="服务器每个请求的延迟（秒）")
+    parser.add_argument("--size", type=int, default=50 * 1024, help="每张图片的字节数")
+    parser.add_argument("--workers", type=int, default=32, help="并发下载数")
+    parser.add_argument("--backends", default="threads,asyncio", help="要测试的下载方式，逗号分隔")
+    args = parser.parse_args()
+
+    server, port = start_server(args.latency, args.size)
+    base = f"http://127.0.0.1:{port}"
+    results = []
+    for backend in args.backends.split(','):
+        # 每种方式使用不同的URL，避免共用任何缓存
+        urls = [f"{base}/{backend}/{i}.png" for i in range(args.count)]
+        count, elapsed = run_backend(backend, urls, args.workers)
+        results.append((backend, count, elapsed))
+    server.terminate()
+
+    print(f"\n{args.count} 张图片，每张 {args.size // 1024} KB，延迟 {args.latency} 秒，并发 {args.workers}")
+    for backend, count, elapsed in results:
+        print(f"{backend:8s} 成功 {count} 张，用时 {elapsed:.2f} 秒，{count / elapsed:.1f} 张/秒")
@@ -1,184 +1,909 @@
 
 import requests
-from bs4 import BeautifulSoup
 from hashlib import md5
 import os
+import argparse
+import base64
 import re
+import html
+import json
 import time
-from urllib.parse import urljoin, urlparse
-from selenium import webdriver
+import struct
+import tempfile
+import threading
+import queue
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlparse, parse_qs
+from browser_pool import BROWSER_PROFILES, FULL_PROFILE, HARVEST_PROFILE, get_driver_pool
+from crawl_ledger import LOCAL_JOURNAL_MODE, SHARED_JOURNAL_MODE, CrawlLedger, EXTRACTING, DOWNLOADING, DONE, FAILED
+from keyword_loader import flatten_taxonomy, job_save_dir, load_jobs
+from net_utils import (BING_REFERER, CIRCUIT_OPEN, DOWNLOAD_OK, TRANSIENT_ERRORS, HostCircuitBreaker, HostRateLimiter,
+                       NotAnImageError, RetryPolicy, TransferWatchdog, classify_exception, classify_status,
+                       get_session)
 
+PAGE_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Referer": BING_REFERER
+}
+IMAGE_HEADERS = {"Referer": BING_REFERER}
+BING_ASYNC_PATH = "/images/async"
+# 网络抓取模式只读取这两类响应：搜索结果页本身和滚动时加载的异步结果片段
+CAPTURE_URL_PATTERN = re.compile(r'/images/(?:search|async)\?')
+# 结果来源：dom（从页面元素读取 m 属性）或 network（从 DevTools 网络事件读取结果响应正文）
+DOM_CAPTURE, NETWORK_CAPTURE = "dom", "network"
+MIN_IMAGE_SIZE = (400, 300)  # 高质量图片的最小宽高
+DOWNLOAD_CHUNK_SIZE = 16 * 1024  # 流式下载的分块大小，每收到一个分块检查一次传输速率
+# (连接超时, 读取超时) 秒：连不上的域名很快放弃；读取超时是两次收到数据之间的最长间隔
+PAGE_TIMEOUT = (5, 15)
+IMAGE_TIMEOUT = (5, 10)
+PROBE_TIMEOUT = (3, 5)
+# 文件头魔数 → 扩展名；WebP（RIFF....WEBP）和 AVIF/HEIC（....ftyp品牌）在 detect_image_type 中单独判断
+IMAGE_SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'GIF87a', 'gif'), (b'GIF89a', 'gif'),
+                    (b'BM', 'bmp'), (b'II*\x00', 'tif'), (b'MM\x00*', 'tif'), (b'\x00\x00\x01\x00', 'ico'))
+# 文件头无法识别时，按 Content-Type 决定扩展名
+CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/pjpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif',
+    'image/webp': 'webp', 'image/bmp': 'bmp', 'image/x-ms-bmp': 'bmp', 'image/tiff': 'tif', 'image/avif': 'avif',
+    'image/heic': 'heic', 'image/x-icon': 'ico', 'image/vnd.microsoft.icon': 'ico',
+}
+# 以这些内容开头的响应是网页、文本或JSON，不是图片
+TEXT_PREFIXES = (b'<!doctype', b'<html', b'<head', b'<body', b'<?xml', b'<svg', b'<!--', b'{', b'[')
+SNIFF_BYTES = 32  # 判断格式需要的文件头长度
+MIN_TRANSFER_RATE = 8 * 1024  # 图片下载的最低平均速度（字节/秒），开始5秒后低于此速度即中止
+MURL_PATTERN = re.compile(r'(?:"|&quot;)murl(?:"|&quot;):(?:"|&quot;)(https://[^"<>]+?)(?:"|&quot;)')
+# 结果图块的 <a> 开始标签（引号内允许出现 >），以及其中的 m / mad 元数据属性
+TILE_TAG_PATTERN = re.compile(r'<a\s(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+META_ATTR_PATTERN = re.compile(r'\s(m|mad)=(?:"(\{[^"]*\})"|\'(\{[^\']*\})\')')
+
+# 尺寸判断结果按URL缓存，最近用过的最多保留 QUALITY_CACHE_SIZE 条，长时间爬取时内存不会一直增长
+QUALITY_CACHE_SIZE = 20000
+_quality_cache = OrderedDict()
+_quality_cache_lock = threading.Lock()
+
+
+class MurlRecord:
+    """一条Bing图片结果：原图、缩略图、来源页、标题和尺寸（未知时为None）"""
+    __slots__ = ('murl', 'turl', 'purl', 'title', 'width', 'height')
+
+    def __init__(self, murl, turl=None, purl=None, title=None, width=None, height=None):
+        self.murl = murl
+        self.turl = turl
+        self.purl = purl
+        self.title = title
+        self.width = width
+        self.height = height
+
+    @property
+    def host(self):
+        return urlparse(self.murl).netloc
+
+    def __repr__(self):
+        return f"MurlRecord({self.murl!r}, {self.width}x{self.height})"
 
-def download_images_from_url(url, save_dir="downloaded_images", max_images=None, delay=1,use_selenium=False):
+
+def download_images_from_url(url, save_dir="downloaded_images", max_images=None, delay=1,use_selenium=False,
+                             workers=8, per_host=4, session=None, min_size=None, store=None, ledger=None,
+                             limiter=None, retry=None, breaker=None, backend="threads", browser_profile=FULL_PROFILE,
+                             capture=DOM_CAPTURE, browser_tabs=1, cancel=None):
     """从指定网页下载所有图片（专注于获取原图）"""
+    # ledger：爬取台账 CrawlLedger，以 save_dir 为词条标识记录进度，中断后跳过已提取的网页和已下载的URL
+    # store：全局图片库 ImageStore，多个词条下载到同一张图片时只保存一份
+    # min_size：(最小宽, 最小高)，传入后先按尺寸筛选再下载，例如 MIN_IMAGE_SIZE
+    # workers：并发下载数。 per_host：同一图片域名的最大并发数。 delay：同一域名两次请求的平均间隔
+    # backend：下载方式，threads（线程池 + requests）或 asyncio（单线程 + aiohttp，适合几十以上的并发数）
+    # browser_profile：use_selenium 时的浏览器配置，full（完整渲染）或 harvest（只采集murl，不加载图片等资源）
+    # capture：use_selenium 时结果的来源，dom（读取页面元素）或 network（读取 DevTools 网络事件中的结果响应）
+    # browser_tabs：use_selenium 时每个浏览器同时打开的窗口数，大于1时多个线程调用本函数可共用一个浏览器
+    # limiter：按域名的限速器 HostRateLimiter，多个词条共用时传入同一个，不传则按 delay 新建
+    # retry：单张图片的重试策略 RetryPolicy，不传则使用默认策略（临时性错误最多尝试4次）
+    # breaker：按域名的熔断器 HostCircuitBreaker，多个词条共用时传入同一个，不传则每个词条新建
+    # session：复用连接的 requests.Session，不传则使用进程内共享的连接池（每个域名16个连接，workers更大时请自行创建）
+    # cancel：threading.Event，被设置后不再开始新的下载，也不再更新台账（分布式模式下租约被其他进程接管时使用）
+    if session is None:
+        session = get_session()
+    if limiter is None:
+        limiter = HostRateLimiter(qps=1 / delay if delay else None, burst=per_host)
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
 
     try:
-        if use_selenium:
-            # 使用Selenium获取动态网页内容
-            html_content = get_dynamic_page_content(url, 16,0.5)
-            soup = BeautifulSoup(html_content, 'html.parser')
-
+        # 上次因 4xx、DNS 等永久性错误失败的URL不再重试
+        original_img_urls = ledger.pending_urls(save_dir, retry_outcomes=TRANSIENT_ERRORS) if ledger else None
+        previous_count = 0
+        if original_img_urls is not None:
+            # 上次已经提取过URL，直接从第一个未下载成功的URL继续
+            previous_count = ledger.done_count(save_dir)
+            print(f"从断点继续：已下载 {previous_count} 张，剩余 {len(original_img_urls)} 个URL")
+            ledger.set_state(save_dir, DOWNLOADING)
+        elif use_selenium:
+            if ledger:
+                ledger.set_state(save_dir, EXTRACTING)
+                previous_count = ledger.done_count(save_dir)
+            # 使用Selenium边滚动边提取：浏览器在后台线程中滚动，每批新结果立即交给下载线程，滚动和下载同时进行
+            original_img_urls = iter_in_background(
+                iter_harvested_urls(url, save_dir, max_images, ledger, min_size, session, workers, browser_profile,
+                                    capture, browser_tabs))
         else:
-            # 发送请求获取网页内容（不使用Selenium）
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-                "Referer": "https://cn.bing.com/images/search"
-            }
-            response = requests.get(url, headers=headers, timeout=15)
-            response.raise_for_status()  # 检查请求是否成功
-
-            # 解析网页提取原图URL
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-        soup_text = soup.prettify()
-        # print(soup_text)
-        original_img_urls = extract_original_image_urls(soup)
-
-        print(f"找到 {len(original_img_urls)} 个原图URL")
-        downloaded_count = 0
-        for i, img_url in enumerate(original_img_urls, 1):
-            if max_images and downloaded_count >= max_images:
-                print(f"已达到最大下载数 {max_images}，停止下载")
-                break
+            if ledger:
+                ledger.set_state(save_dir, EXTRACTING)
+            # 不使用Selenium，直接翻页请求Bing的异步结果片段
+            records = fetch_async_results(url, max_results=max_images, session=session, limiter=limiter)
 
+            print(f"找到 {len(records)} 个原图URL")
             # 质量筛选
-            # if not is_high_quality(img_url):
-            #     print(f"低质量图片，跳过: {img_url}")
-            #     continue
+            if min_size:
+                records = filter_high_quality(records, min_size, session=session, workers=workers)
+            original_img_urls = [record.murl for record in records]
+            if ledger:
+                ledger.save_urls(save_dir, original_img_urls)
+                ledger.set_state(save_dir, DOWNLOADING)
+
+        if cancel is not None:
+            original_img_urls = iter_until_cancelled(original_img_urls, cancel)
 
-            print(f"\n下载第 {i}/{len(original_img_urls)} 张原图: {img_url}")
-            success = download_image(img_url, save_dir)
-            if success:
-                downloaded_count += 1
+        def on_result(img_url, outcome):
+            if cancel is None or not cancel.is_set():
+                ledger.record_url_outcome(save_dir, img_url, outcome)
 
-            # 控制请求间隔
-            time.sleep(delay)
+        remaining = max(max_images - previous_count, 0) if max_images else None
+        downloaded_count = previous_count
+        if remaining != 0 and backend == "asyncio":
+            from async_downloader import download_images_async  # 在这里导入，aiohttp 只在使用时才需要安装
+            downloaded_count += download_images_async(original_img_urls, save_dir, max_images=remaining,
+                                                      workers=workers, per_host=per_host, delay=delay, store=store,
+                                                      on_result=on_result if ledger else None,
+                                                      limiter=limiter, retry=retry, breaker=breaker)
+        elif remaining != 0:
+            downloaded_count += download_images_concurrently(original_img_urls, save_dir, max_images=remaining,
+                                                             workers=workers, per_host=per_host, delay=delay,
+                                                             session=session, store=store,
+                                                             on_result=on_result if ledger else None,
+                                                             limiter=limiter, retry=retry, breaker=breaker)
+        if hasattr(original_img_urls, 'close'):
+            original_img_urls.close()  # 提前达到下载上限时停止滚动，归还浏览器
+        if cancel is not None and cancel.is_set():
+            print(f"\n词条已取消，停止下载 {save_dir}")
+            return None
+        if ledger:
+            ledger.set_state(save_dir, DONE)
 
         print(f"\n下载完成，共保存 {downloaded_count} 张图片到 {save_dir} 文件夹")
+        return downloaded_count
 
     except requests.exceptions.RequestException as e:
         print(f"请求出错: {str(e)}")
+        if ledger and not (cancel is not None and cancel.is_set()):
+            ledger.set_state(save_dir, FAILED, str(e))
     except Exception as e:
         print(f"爬取过程中出错: {str(e)}")
+        if ledger and not (cancel is not None and cancel.is_set()):
+            ledger.set_state(save_dir, FAILED, str(e))
+
+
+def iter_until_cancelled(urls, cancel):
+    """逐个返回 urls 中的URL，cancel 被设置后停止；提前停止时关闭 urls（如正在滚动的页面）"""
+    try:
+        for url in urls:
+            if cancel.is_set():
+                break
+            yield url
+    finally:
+        if hasattr(urls, 'close'):
+            urls.close()
+
+
+def fetch_async_results(url, max_results=None, page_size=35, max_pages=100, session=None, limiter=None,
+                        retry=None):
+    """不打开浏览器，按 first/count 参数翻页请求Bing的异步结果片段，直到没有新结果，返回 MurlRecord 列表"""
+    # url：普通的Bing图片搜索地址，从中取出搜索词 q 和域名
+    # retry：单页请求的重试策略 RetryPolicy，429/5xx 等临时性错误按策略重试同一页，不传则使用默认策略
+    # 某一页重试后仍然失败时停止翻页，返回已获取的结果；第一页就失败时抛出异常
+    if session is None:
+        session = get_session()
+    if retry is None:
+        retry = RetryPolicy()
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query).get('q', [''])[0]
+    async_url = f"{parsed.scheme}://{parsed.netloc}{BING_ASYNC_PATH}"
+
+    records = []
+    seen = set()
+    first = 1
+    for page in range(max_pages):
+        params = {"q": query, "first": first, "count": page_size, "mmasync": 1}
+        attempt = 1
+        while True:
+            if limiter is not None:
+                limiter.wait(async_url)  # 429/503 之后会等到 Retry-After 指定的时间
+            response, error = None, None
+            try:
+                response = session.get(async_url, params=params, headers=PAGE_HEADERS, timeout=PAGE_TIMEOUT)
+                if limiter is not None:
+                    limiter.observe(async_url, response)
+                outcome, detail = classify_status(response.status_code), f"状态码 {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                error = e
+                outcome, detail = classify_exception(e), str(e)
+            if outcome == DOWNLOAD_OK or not retry.should_retry(outcome, attempt):
+                break
+            pause = retry.delay(attempt)
+            print(f"第 {page + 1} 页请求出错（{outcome}: {detail}），{pause:.1f} 秒后第 {attempt + 1} 次尝试")
+            time.sleep(pause)
+            attempt += 1
+        if outcome != DOWNLOAD_OK:
+            if not records:
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+            print(f"第 {page + 1} 页请求失败（{outcome}: {detail}），停止翻页，保留已获取的 {len(records)} 个结果")
+            break
+        new_records = [r for r in extract_image_records(response.content) if r.murl not in seen]
+        if not new_records:
+            print(f"第 {page + 1} 页没有新结果，停止翻页")
+            break
+        seen.update(r.murl for r in new_records)
+        records.extend(new_records)
+        if max_results and len(records) >= max_results:
+            break
+        first += page_size
+    return records
+
+
+def download_images_concurrently(img_urls, save_dir, max_images=None, workers=8, per_host=4, delay=0,
+                                 session=None, store=None, on_result=None, limiter=None, retry=None, breaker=None):
+    """用线程池并发下载原图，返回成功下载的数量"""
+    # img_urls：URL列表，也可以是边提取边产生URL的迭代器（如 iter_harvested_urls），下载与提取同时进行
+    # 同一域名最多 per_host 个线程同时下载，所有线程共用一个按域名的令牌桶限速器代替逐张 time.sleep(delay)
+    # limiter：HostRateLimiter，不传则按每个域名每 delay 秒一个请求新建一个
+    # on_result：每张图片下载结束后在主线程调用 on_result(url, 最终结果)，结果为 DOWNLOAD_OK 或失败类型，用于记录进度
+    # breaker：HostCircuitBreaker，熔断中的域名直接跳过，不占用下载线程
+    if limiter is None:
+        limiter = HostRateLimiter(qps=1 / delay if delay else None, burst=per_host)
+    if breaker is None:
+        breaker = HostCircuitBreaker()
+    outcomes = Counter()
+    host_slots = {}
+    host_lock = threading.Lock()
+    total = len(img_urls) if hasattr(img_urls, '__len__') else '?'
+
+    def get_host_slot(img_url):
+        host = urlparse(img_url).netloc
+        with host_lock:
+            if host not in host_slots:
+                host_slots[host] = threading.BoundedSemaphore(per_host)
+            return host_slots[host]
+
+    def worker(i, img_url):
+        if store is not None and store.lookup_url(img_url):
+            # 已下载过的URL不发请求，不占用域名并发和限速额度
+            return download_image(img_url, save_dir, session=session, store=store)
+        if breaker.is_open(img_url):
+            return CIRCUIT_OPEN
+        with get_host_slot(img_url):
+            limiter.wait(img_url)
+            print(f"\n下载第 {i}/{total} 张原图: {img_url}")
+            return download_image(img_url, save_dir, session=session, store=store, limiter=limiter, retry=retry,
+                                  breaker=breaker)
+
+    def collect(done):
+        count = 0
+        for future in done:
+            outcome = future.result()
+            outcomes[outcome] += 1
+            if on_result:
+                on_result(future_urls.pop(future), outcome)
+            count += 1 if outcome == DOWNLOAD_OK else 0
+        return count
+
+    downloaded_count = 0
+    pending = set()
+    future_urls = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i, img_url in enumerate(img_urls, 1):
+            # 线程全忙，或在途任务全部成功就会达到上限时，先等一个任务结束，避免多下载
+            while pending and (len(pending) >= workers or
+                               (max_images and downloaded_count + len(pending) >= max_images)):
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                downloaded_count += collect(done)
+            if max_images and downloaded_count >= max_images:
+                print(f"已达到最大下载数 {max_images}，停止下载")
+                break
+            future = executor.submit(worker, i, img_url)
+            future_urls[future] = img_url
+            pending.add(future)
+
+        done, _ = wait(pending)
+        downloaded_count += collect(done)
+
+    failed = {outcome: count for outcome, count in outcomes.items() if outcome != DOWNLOAD_OK}
+    if failed:
+        print(f"下载失败统计（临时性错误已重试）：{failed}")
+    return downloaded_count
+
+
+# 返回 [结果图块数量, 页面高度]，Bing 每个结果图块是带 m 属性的 a.iusc
+PAGE_GROWTH_SCRIPT = "return [document.querySelectorAll('a.iusc').length, document.body.scrollHeight];"
+# 滚动到底部，若出现“查看更多结果”按钮则点击
+SCROLL_SCRIPT = """
+window.scrollTo(0, document.body.scrollHeight);
+var more = document.querySelector('a.btn_seemore');
+if (more && more.offsetParent !== null) { more.click(); }
+"""
+# 返回还没取过的结果图块的 [m, mad] 属性，并给这些图块打上标记，下次只返回新出现的图块
+HARVEST_SCRIPT = """
+var tiles = document.querySelectorAll('a.iusc:not([data-harvested])');
+var found = [];
+for (var i = 0; i < tiles.length; i++) {
+    tiles[i].setAttribute('data-harvested', '1');
+    found.push([tiles[i].getAttribute('m'), tiles[i].getAttribute('mad')]);
+}
+return found;
+"""
+
+
+def wait_for_growth(driver, last_state, timeout, poll=0.1):
+    """等待页面结果数或高度增长，返回 (新状态, 用时)；超时未增长时用时为 None"""
+    start = time.monotonic()
+    while True:
+        state = driver.execute_script(PAGE_GROWTH_SCRIPT)
+        elapsed = time.monotonic() - start
+        if state[0] > last_state[0] or state[1] > last_state[1]:
+            return state, elapsed
+        if elapsed >= timeout:
+            return state, None
+        time.sleep(poll)
+
+
+def scroll_steps(driver, max_scrolls, wait_time, target_count=None, patience=2, max_wait=3.0):
+    """不断滚动直到页面不再增长或结果数达到 target_count；首屏加载后和每次滚动后 yield 当前结果图块数量"""
+    # max_scrolls：滚动次数上限。 wait_time：初始每次等待时间，之后按实际加载耗时自动调整
+    # patience：连续多少次滚动没有新内容就停止。 max_wait：单次等待的上限
+    # 等待首屏结果图块出现，最多2秒；页面一有 body 高度就大于0，所以首屏只看图块数量
+    state, _ = wait_for_growth(driver, [0, float('inf')], 2)
+    yield state[0]
+    stale = 0
+    for i in range(max_scrolls):
+        if target_count and state[0] >= target_count:
+            print(f"已加载 {state[0]} 个结果，达到目标数量")
+            break
+        driver.execute_script(SCROLL_SCRIPT)
+        state, load_time = wait_for_growth(driver, state, wait_time)
+        if load_time is None:
+            stale += 1
+            if stale >= patience:
+                print(f"滚动 {i + 1} 次后页面不再增长，共 {state[0]} 个结果")
+                break
+            wait_time = min(wait_time * 2, max_wait)  # 没等到新内容，下次多等一会
+        else:
+            stale = 0
+            # 下次等待时间取实际加载耗时的两倍，限定在 [0.2, max_wait] 之间
+            wait_time = min(max(load_time * 2, 0.2), max_wait)
+            yield state[0]
+
+
+def harvest_new_records(driver):
+    """取出页面上新出现的结果图块的元数据，返回 MurlRecord 列表（只在浏览器中读取属性，不序列化整个页面）"""
+    records = []
+    for m_attr, mad_attr in driver.execute_script(HARVEST_SCRIPT):
+        meta = {}
+        for name, value in (('m', m_attr), ('mad', mad_attr)):
+            try:
+                meta[name] = json.loads(value) if value else None
+            except ValueError:
+                meta[name] = None
+        record = record_from_metadata(meta.get('m'), meta.get('mad'))
+        if record:
+            records.append(record)
+    return records
+
+
+class NetworkCapture:
+    """从 Chrome 的 performance 日志中取出搜索结果响应的正文，浏览器池需要开启 capture_network
+
+    结果片段一到达就能读到，不必序列化整个页面，也不会漏掉滚动后被移出 DOM 的图块。
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._loading = {}  # requestId -> URL，已收到响应头、等待正文加载完成
+        driver.get_log('performance')  # 丢弃这个浏览器之前的页面留下的日志
+
+    def drain(self):
+        """返回自上次调用以来加载完成的结果响应正文列表"""
+        bodies = []
+        for entry in self.driver.get_log('performance'):
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, TypeError, ValueError):
+                continue
+            params = message.get('params') or {}
+            request_id = params.get('requestId')
+            if message.get('method') == 'Network.responseReceived':
+                response_url = (params.get('response') or {}).get('url', '')
+                if CAPTURE_URL_PATTERN.search(response_url):
+                    self._loading[request_id] = response_url
+            elif message.get('method') == 'Network.loadingFinished' and request_id in self._loading:
+                response_url = self._loading.pop(request_id)
+                try:
+                    result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+                except Exception as e:
+                    print(f"读取响应正文失败: {response_url}: {e}")
+                    continue
+                body = result.get('body', '')
+                if result.get('base64Encoded'):
+                    body = base64.b64decode(body).decode('utf-8', errors='replace')
+                bodies.append(body)
+        return bodies
+
+
+def iter_dynamic_records(url, scroll_times, wait_time, pool=None, target_count=None, profile=FULL_PROFILE,
+                         capture=DOM_CAPTURE, tabs=1):
+    """边滚动边提取：每次滚动后 yield 新出现的结果 MurlRecord 列表，调用方可以在浏览器继续滚动的同时下载"""
+    # 参数同 get_dynamic_page_content；调用方提前停止时（关闭生成器）浏览器会归还到池中
+    if pool is None:
+        pool = get_driver_pool(profile, capture_network=capture == NETWORK_CAPTURE, tabs=tabs)
+    with pool.driver() as driver:
+        network = NetworkCapture(driver) if capture == NETWORK_CAPTURE else None
+        driver.get(url)
+        print(f"正在使用Selenium加载网页: {url}")
+        seen = set()
+
+        def new_records():
+            if network:
+                bodies = network.drain()
+                records = extract_image_records('\n'.join(bodies)) if bodies else []
+            else:
+                records = harvest_new_records(driver)
+            batch = [record for record in records if record.murl not in seen]
+            seen.update(record.murl for record in batch)
+            return batch
+
+        for _ in scroll_steps(driver, scroll_times, wait_time, target_count=target_count):
+            batch = new_records()
+            if batch:
+                yield batch
+        if network:
+            # 最后一次检查增长之后才完成的结果片段，滚动结束后再取一次
+            batch = new_records()
+            if batch:
+                yield batch
+
+
+def iter_in_background(iterable):
+    """在后台线程中迭代 iterable，取到的元素经队列交给调用方；生产慢（如滚动页面）时不会阻塞调用方已开始的工作"""
+    # 调用方提前关闭时，后台线程在取完当前元素后停止，并关闭 iterable（生成器中的 with/finally 会执行）
+    items = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                items.put(('item', item))
+                if stop.is_set():
+                    break
+            items.put(('end', None))
+        except BaseException as e:
+            items.put(('error', e))
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == 'end':
+                break
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stop.set()
+        producer.join()
 
-def get_dynamic_page_content(url,scroll_times,wait_time):
-    """打开浏览器，滑动鼠标获取东动态资源，然后获取整体页面代码并返回"""
-    # url：打开的网址。 scroll_times：滑动次数。 wait_time：滑动的时间间隔
-    driver = webdriver.Chrome()
-    driver.get(url)
-    print(f"正在使用Selenium加载网页: {url}")
-    time.sleep(2)
-    for i in range(scroll_times):
-        # 滚动到页面底部
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        # print(f"正在滚动页面 {i + 1}/{scroll_times}")
-        time.sleep(wait_time)  # 等待页面加载
-
-    # 获取完整HTML
-    html_content = driver.page_source
+
+def iter_harvested_urls(url, save_dir, max_images=None, ledger=None, min_size=None, session=None, workers=8,
+                        profile=FULL_PROFILE, capture=DOM_CAPTURE, tabs=1):
+    """用 Selenium 边滚动边提取原图URL，逐个 yield 给下载阶段；提取完成后把词条状态改为下载中"""
+    found = 0
+    for records in iter_dynamic_records(url, 40, 0.5, target_count=max_images, profile=profile, capture=capture,
+                                        tabs=tabs):
+        if min_size:
+            records = filter_high_quality(records, min_size, session=session, workers=workers)
+        urls = [record.murl for record in records]
+        found += len(urls)
+        if ledger:
+            # 先登记再下载；重新提取时跳过上次已经下载成功或永久失败的URL
+            urls = ledger.add_urls(save_dir, urls, retry_outcomes=TRANSIENT_ERRORS)
+        yield from urls
+    print(f"页面滚动结束，共找到 {found} 个原图URL")
+    if ledger:
+        # URL已全部登记，之后中断可以直接从台账继续下载；滚动中途出错时不会执行到这里，下次重新提取
+        ledger.finish_extraction(save_dir)
+
+
+def get_dynamic_page_content(url,scroll_times,wait_time,pool=None,target_count=None,profile=FULL_PROFILE,
+                             capture=DOM_CAPTURE,tabs=1):
+    """从浏览器池取一个浏览器，滑动鼠标获取东动态资源，然后获取整体页面代码并返回"""
+    # url：打开的网址。 scroll_times：最多滑动次数，页面不再增长时提前停止。 wait_time：初始的滑动等待时间
+    # pool：浏览器池，不传则使用进程内共享的池，浏览器用完归还而不是每个词条新开一个
+    # target_count：结果数量达到该值后停止滑动
+    # profile：不传 pool 时使用的浏览器配置，只需要 murl 时用 harvest（不加载图片、字体、音视频，页面更快、内存更小）
+    # capture：network 时不读取 page_source，而是返回浏览器收到的结果页和全部异步结果片段（拼接在一起），
+    #          传入的 pool 需要开启 capture_network
+    # tabs：不传 pool 时每个浏览器同时打开的窗口数，多个线程各取一个窗口，一个窗口等待加载时其他窗口继续滚动
+    if pool is None:
+        pool = get_driver_pool(profile, capture_network=capture == NETWORK_CAPTURE, tabs=tabs)
+    with pool.driver() as driver:
+        network = NetworkCapture(driver) if capture == NETWORK_CAPTURE else None
+        driver.get(url)
+        print(f"正在使用Selenium加载网页: {url}")
+        bodies = []
+        for _ in scroll_steps(driver, scroll_times, wait_time, target_count=target_count):
+            if network:
+                # 每次滚动后及时取走正文，避免浏览器的响应缓存满了之后丢弃早先的片段
+                bodies.extend(network.drain())
+
+        if network:
+            bodies.extend(network.drain())
+            html_content = '\n'.join(bodies)
+        else:
+            # 获取完整HTML
+            html_content = driver.page_source
 
     return html_content
 
 
-def extract_original_image_urls(soup):
-    """从网页内容中提取原图URL（针对Bing图片搜索）"""
-    original_urls = []
-    soup_text = soup.prettify()
-    # 方法1：从script标签中的JSON数据提取原图URL（优先级高）
-    if 'murl' in soup_text or 'thumb' in soup_text:
-        print("进入murl")
-        # print(soup_text)
-        # 使用正则表达式提取JSON中的原图URL
-        # 匹配格式: "murl":"https://example.com/image.jpg"
-        matches = re.findall(r'"murl":"(https://[^"]+)"', soup_text)
-        # print(matches)
-        for url in matches:
-            # 处理转义字符
-            url = url.replace('\\u0026', '&')
-            original_urls.append(url)
-
-    # 方法2：从img标签的data-src属性提取（备用）
-    if not original_urls:
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_tile_metadata(tag):
+    """解析一个结果图块标签中的 m / mad JSON，返回 MurlRecord，没有原图地址时返回None"""
+    meta = {}
+    for name, double_quoted, single_quoted in META_ATTR_PATTERN.findall(tag):
+        try:
+            meta[name] = json.loads(html.unescape(double_quoted or single_quoted))
+        except ValueError:
+            continue
+    return record_from_metadata(meta.get('m'), meta.get('mad'))
+
+
+def record_from_metadata(m, mad=None):
+    """由结果图块的 m / mad 属性（已解析的JSON）生成 MurlRecord，没有原图地址时返回None"""
+    if not isinstance(m, dict) or not str(m.get('murl', '')).startswith('http'):
+        return None
+    if not isinstance(mad, dict):
+        mad = {}
+    width = _to_int(m.get('w') or mad.get('maw') or mad.get('w'))
+    height = _to_int(m.get('h') or mad.get('mah') or mad.get('h'))
+    return MurlRecord(m['murl'], turl=m.get('turl') or mad.get('turl'), purl=m.get('purl'),
+                      title=m.get('t'), width=width, height=height)
+
+
+def extract_image_records(page, use_img_fallback=False):
+    """从网页内容中提取原图及其元数据（针对Bing图片搜索），返回 MurlRecord 列表"""
+    # page：原始HTML（str/bytes），直接用正则扫描，不构建DOM也不prettify
+    # use_img_fallback：没有murl时是否解析DOM，从img标签取图片地址
+    if isinstance(page, bytes):
+        page = page.decode('utf-8', errors='replace')
+    elif not isinstance(page, str):
+        page = str(page)  # 兼容旧的调用方式：传入BeautifulSoup对象
+
+    records = {}
+    # 方法1：解析结果图块 m 属性中的完整JSON（原图、缩略图、来源页、标题、尺寸）
+    for tag in TILE_TAG_PATTERN.findall(page):
+        if 'murl' not in tag:
+            continue
+        record = parse_tile_metadata(tag)
+        if record and record.murl not in records:
+            records[record.murl] = record
+
+    # 方法2：从脚本JSON中只提取原图URL，补上方法1没有覆盖到的
+    # 匹配格式: "murl":"https://example.com/image.jpg"，或页面源码中转义后的 &quot;murl&quot;:&quot;...&quot;
+    for url in MURL_PATTERN.findall(page):
+        # 处理转义字符
+        url = html.unescape(url).replace('\\u0026', '&')
+        if url not in records:
+            records[url] = MurlRecord(url)
+
+    # 方法3：从img标签的data-src属性提取（备用）
+    if not records:
         print("没有发现murl")
-        return
+        if not use_img_fallback:
+            return []
+        from bs4 import BeautifulSoup  # 在这里导入，只有备用解析才需要 bs4
+        soup = BeautifulSoup(page, 'html.parser')
         for img in soup.find_all('img'):
-            print(img)
             data_src = img.get('data-src') or img.get('src')
             if data_src and 'th.bing.com' not in data_src and data_src.startswith('http'):
-                original_urls.append(data_src)
+                records.setdefault(data_src, MurlRecord(data_src))
+
+    # 按murl去重（保持页面中的先后顺序）
+    return list(records.values())
+
+
+def extract_original_image_urls(page, use_img_fallback=False):
+    """从网页内容中提取原图URL（针对Bing图片搜索）"""
+    return [record.murl for record in extract_image_records(page, use_img_fallback)]
+
+
+def detect_image_type(head, content_type=None):
+    """按文件头魔数判断图片格式，返回扩展名；无法识别时参考 Content-Type；网页、文本等非图片内容返回None"""
+    if not head:
+        return None
+    for magic, ext in IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp':
+        brand = head[8:12]
+        if brand in (b'avif', b'avis'):
+            return 'avif'
+        if brand in (b'heic', b'heix', b'mif1', b'msf1'):
+            return 'heic'
+    if head.lstrip(b'\xef\xbb\xbf \t\r\n')[:9].lower().startswith(TEXT_PREFIXES):
+        return None
+    mime = (content_type or '').split(';')[0].strip().lower()
+    return CONTENT_TYPE_EXTENSIONS.get(mime)
+
+
+def sniff_image_type(head, content_type=None):
+    """同 detect_image_type，不是图片时抛出 NotAnImageError"""
+    ext = detect_image_type(head, content_type)
+    if ext is None:
+        preview = head[:SNIFF_BYTES].decode('latin-1').replace('\n', ' ')
+        raise NotAnImageError(f"Content-Type: {content_type or '无'}，开头: {preview!r}")
+    return ext
+
+
+def parse_image_size(data):
+    """从图片文件头解析宽高（支持 JPEG/PNG/GIF/BMP/WebP），无法识别时返回None"""
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+            return struct.unpack('>II', data[16:24])
+        if data[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', data[6:10])
+        if data[:2] == b'BM':
+            width, height = struct.unpack('<ii', data[18:26])
+            return width, abs(height)
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b'VP8L':
+                bits = int.from_bytes(data[21:25], 'little')
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b'VP8X':
+                return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+        if data[:2] == b'\xff\xd8':
+            # JPEG：逐个跳过标记段，直到遇到记录尺寸的SOF段
+            i = 2
+            while i + 9 < len(data):
+                if data[i] != 0xFF:
+                    i += 1
+                    continue
+                marker = data[i + 1]
+                if marker == 0xFF:
+                    i += 1
+                    continue
+                if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                    i += 2
+                    continue
+                if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                    return width, height
+                i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    except struct.error:
+        pass
+    return None
+
 
-    # 去重
-    return list(set(original_urls))
+def probe_image(img_url, session=None, probe_bytes=65536):
+    """只请求图片开头的一段字节，返回 (宽高或None, 文件总大小或None)"""
+    if session is None:
+        session = get_session()
+    headers = dict(IMAGE_HEADERS, Range=f"bytes=0-{probe_bytes - 1}")
+    with session.get(img_url, headers=headers, stream=True, timeout=PROBE_TIMEOUT) as response:
+        if response.status_code not in (200, 206):
+            return None, None
+        data = response.raw.read(probe_bytes, decode_content=True)
+        content_range = response.headers.get('Content-Range', '')
+        if '/' in content_range and not content_range.endswith('*'):
+            total = _to_int(content_range.rsplit('/', 1)[1])
+        else:
+            total = _to_int(response.headers.get('Content-Length'))
+    return parse_image_size(data), total
 
 
-def is_high_quality(img_url):
-    """检查图片是否为高质量（通过URL参数或Content-Length判断）"""
+def is_high_quality(img_url, session=None, min_size=MIN_IMAGE_SIZE):
+    """检查图片是否为高质量（通过URL参数、文件头中的尺寸或文件大小判断），结果按URL缓存"""
     # 通过URL参数判断（Bing图片通常包含尺寸信息）
     if 'w=1920' in img_url or 'h=1080' in img_url or 'q=90' in img_url:
         return True
 
-    # 尝试预请求获取Content-Length
+    cache_key = (img_url, min_size)
+    with _quality_cache_lock:
+        if cache_key in _quality_cache:
+            _quality_cache.move_to_end(cache_key)
+            return _quality_cache[cache_key]
+
+    # 尝试预请求图片开头，解析宽高；解析不出时退回用文件大小判断
+    verdict = False
     try:
-        response = requests.head(img_url, timeout=5, headers={
-            "User-Agent": "Mozilla/5.0"
-        })
-        if response.status_code == 200:
-            content_length = response.headers.get('Content-Length')
-            if content_length and int(content_length) > 400 * 300:  # 大于300KB
-                return True
-    except:
-        pass
+        size, total = probe_image(img_url, session)
+    except Exception:
+        # 预请求失败（如超时）可能只是暂时的，不缓存，之后再遇到这个URL时重新判断
+        return False
+    if size:
+        verdict = size[0] >= min_size[0] and size[1] >= min_size[1]
+    elif total:
+        verdict = total > min_size[0] * min_size[1]
+
+    with _quality_cache_lock:
+        _quality_cache[cache_key] = verdict
+        if len(_quality_cache) > QUALITY_CACHE_SIZE:
+            _quality_cache.popitem(last=False)
+    return verdict
+
+
+def filter_high_quality(records, min_size=MIN_IMAGE_SIZE, session=None, workers=8):
+    """按尺寸筛选结果：元数据里有宽高的直接判断，没有的才并发预请求，返回保留的记录"""
+    verdicts = {}
+    unknown = []
+    for record in records:
+        if record.width and record.height:
+            verdicts[record.murl] = record.width >= min_size[0] and record.height >= min_size[1]
+        else:
+            unknown.append(record.murl)
+
+    if unknown:
+        print(f"{len(unknown)} 个结果没有尺寸信息，预请求图片头判断")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for murl, verdict in zip(unknown, executor.map(lambda u: is_high_quality(u, session, min_size), unknown)):
+                verdicts[murl] = verdict
+
+    kept = [record for record in records if verdicts[record.murl]]
+    print(f"尺寸筛选：保留 {len(kept)}/{len(records)} 张")
+    return kept
+
+
+def iter_available(response, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """逐次返回已经到达的数据（每次最多 chunk_size 字节），不等凑满一个分块，慢速传输也能及时检查速度"""
+    raw = response.raw
+    if not hasattr(raw, 'read1'):
+        # urllib3 2.3 之前没有 read1，只能按完整分块读取
+        yield from response.iter_content(chunk_size)
+        return
+    while True:
+        chunk = raw.read1(chunk_size, decode_content=True)
+        if not chunk:
+            break
+        yield chunk
+
+
+def save_stream(response, save_dir, ext=None, store=None, url=None, min_rate=MIN_TRANSFER_RATE):
+    """边接收边计算MD5并写入临时文件，完成后原子地重命名为 <md5>.<ext>，返回 (文件名, 是否新保存)"""
+    # ext：扩展名，None 表示按文件头和 Content-Type 判断；内容不是图片时在写文件前抛出 NotAnImageError
+    # store：全局图片库 ImageStore，传入时图片存入图片库，词条目录只保存引用
+    # min_rate：最低平均速度（字节/秒），低于此速度抛出 SlowTransferError，None 表示不检查
+    # iter_content 要等凑满一个分块才返回，每秒只发几百字节的源站要很久才会被检查一次；这里收到数据就检查
+    watchdog = TransferWatchdog(min_rate)
+    chunks = iter_available(response)
+    first_chunk = b''
+    for chunk in chunks:
+        first_chunk += chunk
+        watchdog.update(len(chunk))
+        if len(first_chunk) >= SNIFF_BYTES:
+            break
+    if ext is None:
+        ext = sniff_image_type(first_chunk, response.headers.get('Content-Type'))
+    digest = md5()
+    fd, tmp_path = tempfile.mkstemp(suffix='.part', dir=store.tmp_dir if store else save_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            digest.update(first_chunk)
+            f.write(first_chunk)
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                watchdog.update(len(chunk))
+        return finish_download(tmp_path, digest.hexdigest(), ext, save_dir, store, url)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def finish_download(tmp_path, digest, ext, save_dir, store=None, url=None):
+    """把下载完成的临时文件按MD5命名保存（或存入图片库），返回 (文件名, 是否新保存)"""
+    if store is not None:
+        return store.add(tmp_path, digest, ext, save_dir, url=url)
+    file_name = f"{digest}.{ext}"
+    file_path = os.path.join(save_dir, file_name)
+    # 保存图片（仅当文件不存在时保存）
+    if os.path.exists(file_path):
+        os.remove(tmp_path)
+        return file_name, False
+    os.replace(tmp_path, file_path)
+    return file_name, True
+
+
+def link_known_url(url, save_dir, store):
+    """URL在图片库中已有记录时直接关联到词条目录，返回是否已关联"""
+    known = store.lookup_url(url)
+    if not known:
+        return False
+    file_name, added = store.add_reference(known[0], known[1], save_dir)
+    print(f"URL已下载过，{'关联' if added else '跳过'}: {file_name}")
+    return True
+
+
+def download_image(url, save_dir, session=None, store=None, limiter=None, retry=None, breaker=None):
+    """下载单张图片并使用MD5去重，临时性错误按重试策略退避重试，返回最终结果（DOWNLOAD_OK 或失败类型）"""
+    # limiter：HostRateLimiter，传入时根据响应状态（429/503）对该域名退避，重试前也会等待限速
+    # retry：RetryPolicy，不传则使用默认策略
+    # breaker：HostCircuitBreaker，传入时记录每次请求的结果，域名熔断后不再重试
+    if session is None:
+        session = get_session()
+    if retry is None:
+        retry = RetryPolicy()
+    # 发请求前先查URL索引，下载过的图片直接关联到词条目录
+    if store is not None and link_known_url(url, save_dir, store):
+        return DOWNLOAD_OK
 
-    return False
+    attempt = 1
+    while True:
+        if breaker is not None and not breaker.allow(url):
+            outcome, detail = CIRCUIT_OPEN, "域名熔断中"
+            break
+        outcome, detail = fetch_image(url, save_dir, session, store, limiter)
+        if breaker is not None:
+            breaker.record(url, outcome)
+        if outcome == DOWNLOAD_OK or not retry.should_retry(outcome, attempt):
+            break
+        pause = retry.delay(attempt)
+        print(f"下载出错（{outcome}: {detail}），{pause:.1f} 秒后第 {attempt + 1} 次尝试: {url}")
+        time.sleep(pause)
+        if limiter is not None:
+            limiter.wait(url)
+        attempt += 1
 
+    if outcome != DOWNLOAD_OK:
+        print(f"下载失败（{outcome}: {detail}，共尝试 {attempt} 次）: {url}")
+    return outcome
 
-def download_image(url, save_dir):
-    """下载单张图片并使用MD5去重"""
+
+def fetch_image(url, save_dir, session, store=None, limiter=None):
+    """请求并保存一次图片，返回 (结果, 说明)，失败时结果为失败类型"""
     try:
-        # 发送图片请求
-        response = requests.get(url, stream=True, timeout=15,
-                                headers={
-                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                                    "Referer": "https://cn.bing.com/images/search"
-                                })
-
-        if response.status_code == 200:
-            # 计算图片MD5值用于去重
-            img_md5 = md5(response.content).hexdigest()
-
-            # 获取文件扩展名
-            url_path = urlparse(url).path
-            ext = url_path.split('.')[-1].lower() if '.' in url_path else 'jpg'
-
-            # 支持的图片格式
-            valid_extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']
-            if ext not in valid_extensions:
-                ext = 'jpg'  # 默认使用jpg格式
-
-            # 生成唯一文件名
-            file_name = f"{img_md5}.{ext}"
-            file_path = os.path.join(save_dir, file_name)
-
-            # 保存图片（仅当文件不存在时保存）
-            if not os.path.exists(file_path):
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(1024):
-                        f.write(chunk)
+        # 发送图片请求（复用连接池中的连接）
+        with session.get(url, stream=True, timeout=IMAGE_TIMEOUT, headers=IMAGE_HEADERS) as response:
+            if limiter is not None:
+                limiter.observe(url, response)
+            outcome = classify_status(response.status_code)
+            if outcome != DOWNLOAD_OK:
+                return outcome, f"状态码 {response.status_code}"
+
+            # 流式写入，内存中只保留一个分块，文件名为内容的MD5，扩展名按文件头判断（不信任URL中的扩展名）
+            # 连接中途断开时不会留下不完整的文件，HTML错误页等非图片内容不会写入磁盘
+            file_name, saved = save_stream(response, save_dir, store=store, url=url)
+            if saved:
                 print(f"成功保存: {file_name}")
-                return True
             else:
                 print(f"图片已存在，跳过: {file_name}")
-                return True
-        else:
-            print(f"图片请求失败，状态码: {response.status_code}")
-            return False
+            return DOWNLOAD_OK, file_name
 
     except Exception as e:
-        print(f"下载图片时出错: {str(e)}")
-        return False
+        return classify_exception(e), str(e)
 
 
 if __name__ == "__main__":
@@ -501,15 +1226,53 @@ if __name__ == "__main__":
         },  # 500
 
 }
-    for Secondary_directories in search_arr_s:
-        print(f"当前字典：{Secondary_directories}")
-        for search_arr_name in search_arr_s[Secondary_directories]:
-            print(f"当前数组：{search_arr_name}")
-            for search in search_arr_s[Secondary_directories][search_arr_name]:
-                print(f"词条:{search}")
-
-                # 爬取的网页URL
-                target_url = f"https://cn.bing.com/images/search?q={search}"
-
-                # 调用函数开始爬取（可自定义保存目录和最大下载数）
-                download_images_from_url(target_url, save_dir=rf"{Secondary_directories}\{search_arr_name}\{search}", max_images=5000, delay=0.5,use_selenium=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="按词条批量爬取Bing原图")
+    parser.add_argument("files", nargs="*", help="词条文件（.py/.json/.yaml），不传则使用上面的 search_arr_s")
+    parser.add_argument("--processes", type=int, default=1, help="并行爬取的进程数，默认1")
+    parser.add_argument("--ledger", default="crawl_ledger.sqlite3", help="台账文件，分布式模式下放在共享存储上")
+    parser.add_argument("--store", default="image_store", help="图片库目录")
+    parser.add_argument("--distributed", action="store_true",
+                        help="分布式模式：多台机器使用同一个台账，按租约领取词条")
+    parser.add_argument("--backend", choices=("threads", "asyncio"), default="threads",
+                        help="图片下载方式：threads（默认）或 asyncio（需要 aiohttp）")
+    parser.add_argument("--workers", type=int, default=8, help="每个进程同时下载的图片数，默认8")
+    parser.add_argument("--browser-profile", choices=BROWSER_PROFILES, default=HARVEST_PROFILE,
+                        help="浏览器配置：harvest（默认，只采集murl，不加载图片、字体、音视频）或 full（完整渲染）")
+    parser.add_argument("--capture", choices=(DOM_CAPTURE, NETWORK_CAPTURE), default=DOM_CAPTURE,
+                        help="结果来源：dom（默认，读取页面元素）或 network（读取浏览器收到的结果响应）")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只读取词条并列出保存目录，不登记台账、不爬取")
+    parser.add_argument("--tabs", type=int, default=1,
+                        help="每个进程同时爬取的词条数，这些词条共用一个浏览器的不同窗口，默认1（network 模式不支持）")
+    args = parser.parse_args()
+    if args.tabs > 1 and args.capture == NETWORK_CAPTURE:
+        # performance 日志是整个浏览器共用的，无法区分属于哪个窗口
+        parser.error("--capture network 不支持多个窗口，请去掉 --tabs 或改用 --capture dom")
+
+    # 传入词条文件时（如 python bing_getImg_murl.py 词条/Test.py 词条/Test2.py）从文件读取
+    if args.files:
+        jobs = load_jobs(args.files)
+    else:
+        jobs = flatten_taxonomy(search_arr_s)
+    if args.dry_run:
+        for job in jobs:
+            print(f"{job_save_dir(job)}\t{job.search}")
+        print(f"共 {len(jobs)} 个词条")
+        raise SystemExit(0)
+
+    # 爬取台账：先按顺序登记全部词条，中断后重新运行会从第一个未完成的词条继续
+    # 重复登记是安全的，分布式模式下每台机器都可以用同样的参数启动
+    ledger = CrawlLedger(args.ledger, SHARED_JOURNAL_MODE if args.distributed else LOCAL_JOURNAL_MODE)
+    ledger.add_jobs((job_save_dir(job), job.search) for job in jobs)
+    print(f"台账状态：{ledger.summary()}")
+
+    # 所有词条共用一个图片库，重复图片在词条目录中以硬链接形式出现；每个进程各自使用浏览器和连接池
+    from crawl_scheduler import run_keyword_jobs, run_queue_workers  # 在这里导入，避免与本模块循环导入
+    if args.distributed:
+        run_queue_workers(args.ledger, args.store, processes=args.processes, max_images=5000, delay=0.5,
+                          use_selenium=True, backend=args.backend, workers=args.workers,
+                          browser_profile=args.browser_profile, capture=args.capture, browser_tabs=args.tabs)
+    else:
+        run_keyword_jobs(args.ledger, args.store, processes=args.processes, max_images=5000, delay=0.5,
+                         use_selenium=True, backend=args.backend, workers=args.workers,
+                         browser_profile=args.browser_profile, capture=args.capture, browser_tabs=args.tabs)
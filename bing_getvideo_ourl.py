@@ -1,14 +1,16 @@
 import requests
-from bs4 import BeautifulSoup
 import re
 import time
-from selenium import webdriver
 import os
 import subprocess
+from net_utils import HostRateLimiter
 
 
-def download_images_from_url(url, save_dir="downloaded_images", max_images=None, delay=1,use_selenium=False):
+def download_images_from_url(url, save_dir="downloaded_images", max_images=None, delay=1,use_selenium=False,
+                             limiter=None):
     """从指定网页获取所有视频的链接"""
+    # limiter：按域名的限速器 HostRateLimiter，翻页时传入同一个以控制对bilibili的请求频率
+    from bs4 import BeautifulSoup  # 在这里导入，减少启动时间
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
 
@@ -25,7 +27,11 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
                 "Referer": "https://www.bilibili.com/"
             }
+            if limiter is not None:
+                limiter.wait(url)
             response = requests.get(url, headers=headers, timeout=15)
+            if limiter is not None:
+                limiter.observe(url, response)
             response.raise_for_status()  # 检查请求是否成功
 
             # 解析网页提取原图URL
@@ -48,6 +54,7 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
 def get_dynamic_page_content(url,scroll_times,wait_time):
     """打开浏览器，滑动鼠标获取东动态资源，然后获取整体页面代码并返回"""
     # url：打开的网址。 scroll_times：滑动次数。 wait_time：滑动的时间间隔
+    from selenium import webdriver  # 在这里导入，不使用Selenium时不必加载
     driver = webdriver.Chrome()
     driver.get(url)
     print(f"正在使用Selenium加载网页: {url}")
@@ -65,6 +72,7 @@ def get_dynamic_page_content(url,scroll_times,wait_time):
 
 def get_pages_selenium(url):
     """打开网页获取最大页码（暂时无效）"""
+    from selenium import webdriver
     driver = webdriver.Chrome()
     driver.get(url)
     print(f"正在使用Selenium加载网页: {url}")
@@ -126,12 +134,13 @@ if __name__ == "__main__":
     # time.sleep(2000)
     # 爬取的网页URL
     url_arr=[]
+    limiter = HostRateLimiter(qps=2, burst=1)  # 翻页请求按域名限速，遇到 429/503 自动退避
     for num in range(1,2):
         # 爬取前20页，视频链接。
         target_url = f"https://search.bilibili.com/all?keyword={search}&page={num}"
 
         # 调用函数开始爬取（可自定义保存目录和最大下载数）
-        a_url_arr = download_images_from_url(target_url, save_dir=rf"D:\Projects\TestProjects\bing\downloads\{search}", max_images=5000, delay=0.5, use_selenium=False)
+        a_url_arr = download_images_from_url(target_url, save_dir=rf"D:\Projects\TestProjects\bing\downloads\{search}", max_images=5000, delay=0.5, use_selenium=False, limiter=limiter)
         url_arr = list(set(url_arr + a_url_arr))
     print(len(url_arr))
     print(url_arr)
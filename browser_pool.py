@@ -0,0 +1,363 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+# 浏览器配置：full 为完整渲染；harvest 只用于采集结果图块的 murl 元数据，不加载图片、字体和音视频
+FULL_PROFILE, HARVEST_PROFILE = "full", "harvest"
+BROWSER_PROFILES = (FULL_PROFILE, HARVEST_PROFILE)
+# harvest 配置下通过 DevTools 拦截的请求：缩略图（Bing 缩略图地址没有扩展名）、字体、音视频
+# CSS 不拦截：Bing 靠图块的布局高度触发无限滚动，没有样式时页面不会继续加载
+HARVEST_BLOCKED_URLS = [
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.mm.bing.net/th*", "*th.bing.com/th*",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.m3u8", "*.mp3",
+]
+
+# webdriver_manager 解析出的 chromedriver 路径缓存在这里，过期前直接使用，不再联网查询版本
+DRIVER_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "bing_selenium_murl", "chromedriver.json")
+DRIVER_CACHE_MAX_AGE = 7 * 24 * 3600
+
+_shared_pools = {}
+_shared_pool_lock = threading.Lock()
+
+
+def resolve_chromedriver(cache_path=DRIVER_CACHE_PATH, max_age=DRIVER_CACHE_MAX_AGE):
+    """返回 chromedriver 的路径：优先使用磁盘缓存，缓存过期或文件已不存在时才用 webdriver_manager 解析（可能联网）"""
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached['resolved'] < max_age and os.path.exists(cached['path']):
+            return cached['path']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    from webdriver_manager.chrome import ChromeDriverManager  # 在这里导入，只有需要解析时才加载
+    path = ChromeDriverManager().install()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # 先写临时文件再替换，多个进程同时解析时不会读到写了一半的缓存
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': path, 'resolved': time.time()}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"无法写入 chromedriver 路径缓存: {e}")
+    return path
+
+
+def build_chrome_options(headless=True, profile=FULL_PROFILE, capture_network=False):
+    """生成采集用的 Chrome 启动参数"""
+    # capture_network：开启 performance 日志，用于从 DevTools 网络事件中读取响应正文
+    from selenium import webdriver  # 在这里导入，只用 requests 爬取时不必加载 selenium
+    options = webdriver.ChromeOptions()
+    if headless or profile == HARVEST_PROFILE:
+        options.add_argument("--headless=new")  # 无头模式，不显示浏览器窗口
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")  # 服务器环境需要
+    options.add_argument("--disable-dev-shm-usage")
+    # 多个标签页共用一个浏览器时，后台标签页的定时器和渲染不降速，滚动加载照常进行
+    options.add_argument("--disable-background-timer-throttling")
+    options.add_argument("--disable-renderer-backgrounding")
+    options.add_argument("--disable-backgrounding-occluded-windows")
+    if profile == HARVEST_PROFILE:
+        # 小窗口减少每次滚动需要排版的图块；不加载图片；DOM 就绪即返回，不等图片等资源加载完
+        options.add_argument("--window-size=800,600")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--mute-audio")
+        options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2})
+        options.page_load_strategy = "eager"
+    else:
+        options.add_argument("--window-size=1920,1080")
+    if capture_network:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    return options
+
+
+class DriverPool:
+    """浏览器池：启动 size 个 Chrome 反复使用，每个浏览器打开 max_pages 个页面后重启"""
+
+    def __init__(self, size=1, max_pages=50, headless=True, options_factory=None, profile=FULL_PROFILE,
+                 capture_network=False):
+        # options_factory：返回 ChromeOptions 的函数，不传则使用 build_chrome_options
+        # profile：浏览器配置 full / harvest，harvest 会额外用 DevTools 拦截字体、音视频和缩略图请求
+        # capture_network：浏览器是否记录网络事件（performance 日志），网络抓取模式需要
+        self.size = size
+        self.max_pages = max_pages
+        self.profile = profile
+        self.options_factory = options_factory or (lambda: build_chrome_options(headless, profile, capture_network))
+        self._idle = queue.Queue()
+        self._page_counts = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _new_driver(self):
+        from selenium import webdriver
+        driver = webdriver.Chrome(options=self.options_factory())
+        self._page_counts[id(driver)] = 0
+        self.prepare_tab(driver)
+        return driver
+
+    def prepare_tab(self, driver):
+        """对浏览器当前标签页应用配置（DevTools 设置只对当前标签页生效，新开的标签页需要再调用一次）"""
+        if self.profile == HARVEST_PROFILE:
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": HARVEST_BLOCKED_URLS})
+            except Exception as e:
+                print(f"无法拦截资源请求（浏览器不支持 DevTools 协议），只按启动参数屏蔽图片: {e}")
+
+    def acquire(self, timeout=None):
+        """取出一个空闲浏览器，池未满时新建，池满时等待其他任务归还"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("浏览器池已关闭")
+                create = self._idle.empty() and self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    return self._new_driver()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            # 短暂等待后重新检查：其他任务回收浏览器后这里可以补建新的
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("等待空闲浏览器超时")
+
+    def release(self, driver, broken=False):
+        """归还浏览器：清理状态，达到页数上限或出错时关闭，下次取用时重新启动"""
+        self._page_counts[id(driver)] = self._page_counts.get(id(driver), 0) + 1
+        if not broken and not self._closed and self._page_counts[id(driver)] < self.max_pages:
+            try:
+                self._reset(driver)
+                self._idle.put(driver)
+                return
+            except Exception as e:
+                print(f"浏览器状态清理失败，重启浏览器: {e}")
+        self._quit(driver)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """with pool.driver() as driver: ... 用完自动归还"""
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken)
+
+    def _reset(self, driver):
+        # 只保留一个标签页，清空 cookie 和本地存储，回到空白页
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.delete_all_cookies()
+        driver.execute_script("try { localStorage.clear(); sessionStorage.clear(); } catch (e) {}")
+        driver.get("about:blank")
+
+    def _quit(self, driver):
+        self._page_counts.pop(id(driver), None)
+        with self._lock:
+            self._created -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"关闭浏览器出错: {e}")
+
+    def close(self):
+        """关闭池中所有空闲浏览器"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+
+class BrowserTab:
+    """浏览器中的一个标签页，用法与 WebDriver 相同：每条命令先切换到本标签页再执行，多个线程可以各用一个标签页"""
+
+    def __init__(self, driver, handle, tab_pool):
+        self._driver = driver
+        self.handle = handle
+        self._tab_pool = tab_pool
+
+    def _activate(self):
+        if self._tab_pool.active_handle != self.handle:
+            self._driver.switch_to.window(self.handle)
+            self._tab_pool.active_handle = self.handle
+
+    def __getattr__(self, name):
+        if callable(getattr(type(self._driver), name, None)):
+            def command(*args, **kwargs):
+                with self._tab_pool.command_lock:
+                    self._activate()
+                    return getattr(self._driver, name)(*args, **kwargs)
+            return command
+        # page_source、current_url 等属性读取时也会向浏览器发命令
+        with self._tab_pool.command_lock:
+            self._activate()
+            return getattr(self._driver, name)
+
+
+class TabPool:
+    """在一个浏览器中同时打开 tabs 个窗口，每个词条占用一个：一个窗口等待滚动加载时，其他窗口可以继续操作
+
+    浏览器从 driver_pool 中取出，所有窗口累计打开 max_pages 个页面后，等全部窗口归还再重启浏览器。
+    接口与 DriverPool 相同（acquire / release / driver / close），取到的是 BrowserTab。
+    """
+
+    def __init__(self, driver_pool, tabs=4, max_pages=None):
+        self.driver_pool = driver_pool
+        self.tabs = tabs
+        self.max_pages = max_pages or driver_pool.max_pages
+        self.command_lock = threading.RLock()  # 同一时刻只有一个线程向浏览器发命令
+        self.active_handle = None
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._browser = None
+        self._busy = 0
+        self._pages = 0
+        self._retiring = False
+        self._broken = False
+        self._closed = False
+
+    def _open_browser(self):
+        driver = self.driver_pool.acquire()
+        try:
+            handles = [driver.current_window_handle]
+            for _ in range(self.tabs - 1):
+                driver.switch_to.new_window('window')
+                self.driver_pool.prepare_tab(driver)
+                handles.append(driver.current_window_handle)
+        except Exception:
+            self.driver_pool.release(driver, broken=True)
+            raise
+        self.active_handle = handles[-1]
+        self._browser = driver
+        self._pages = 0
+        self._retiring = self._broken = False
+        for handle in handles:
+            self._idle.put(handle)
+
+    def acquire(self, timeout=None):
+        """取出一个空闲标签页，没有浏览器时先启动一个并打开 tabs 个窗口；浏览器待重启时等它关闭后再启动新的"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("浏览器池已关闭")
+                if self._browser is None:
+                    self._open_browser()
+                try:
+                    handle = self._idle.get_nowait()
+                    self._busy += 1
+                    return BrowserTab(self._browser, handle, self)
+                except queue.Empty:
+                    pass
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("等待空闲标签页超时")
+            time.sleep(0.1)
+
+    def release(self, tab, broken=False):
+        """归还标签页：回到空白页；浏览器出错或页数达到上限时，等所有标签页归还后重启浏览器"""
+        if not broken:
+            try:
+                tab.get("about:blank")
+            except Exception as e:
+                print(f"标签页状态清理失败，重启浏览器: {e}")
+                broken = True
+        with self._lock:
+            self._busy -= 1
+            self._pages += 1
+            self._broken = self._broken or broken
+            if not self._retiring and (self._broken or self._closed or self._pages >= self.max_pages):
+                # 不再分配这个浏览器的空闲标签页，acquire 会等仍在使用的标签页归还、浏览器重启后再分配
+                self._retiring = True
+                while not self._idle.empty():
+                    self._idle.get_nowait()
+            if not self._retiring:
+                self._idle.put(tab.handle)
+            elif self._busy == 0:
+                self._close_browser()
+
+    def _close_browser(self):
+        # 在 self._lock 内调用：丢弃空闲标签页，把浏览器交还给 driver_pool（按出错处理，直接关闭）
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        browser, self._browser = self._browser, None
+        self.active_handle = None
+        if browser is not None:
+            self.driver_pool.release(browser, broken=True)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        """with pool.driver() as tab: ... 用完自动归还"""
+        tab = self.acquire(timeout)
+        broken = False
+        try:
+            yield tab
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(tab, broken)
+
+    def close(self):
+        """关闭浏览器；仍在使用的标签页归还后再关闭"""
+        with self._lock:
+            self._closed = self._retiring = True
+            if self._busy == 0:
+                self._close_browser()
+        self.driver_pool.close()
+
+
+def get_driver_pool(profile=FULL_PROFILE, capture_network=False, tabs=1):
+    """返回进程内共享的浏览器池（每种配置一个），进程退出时自动关闭全部浏览器"""
+    # tabs：大于1时返回 TabPool，多个词条共用一个浏览器的不同窗口
+    key = (profile, capture_network, tabs)
+    pool = _shared_pools.get(key)
+    if pool is None:
+        if profile not in BROWSER_PROFILES:
+            raise ValueError(f"未知的浏览器配置: {profile}，可选 {BROWSER_PROFILES}")
+        if capture_network and tabs > 1:
+            # performance 日志是整个浏览器共用的，无法区分属于哪个标签页
+            raise ValueError("网络抓取模式不支持多标签页")
+        with _shared_pool_lock:
+            if not _shared_pools:
+                atexit.register(close_driver_pools)
+            pool = _shared_pools.get(key)
+            if pool is None:
+                pool = DriverPool(profile=profile, capture_network=capture_network)
+                if tabs > 1:
+                    pool = TabPool(pool, tabs)
+                _shared_pools[key] = pool
+    return pool
+
+
+def close_driver_pools():
+    """关闭进程内所有共享浏览器池"""
+    with _shared_pool_lock:
+        pools = list(_shared_pools.values())
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import threading
+import time
+
+# 词条的状态：等待、提取URL中、下载中、完成、失败
+PENDING, EXTRACTING, DOWNLOADING, DONE, FAILED = "pending", "extracting", "downloading", "done", "failed"
+UNFINISHED_STATES = (PENDING, EXTRACTING, DOWNLOADING, FAILED)
+# 租约相关字段：持有者、租约到期时间、已领取次数、最后一次的下载数量
+LEASE_COLUMNS = (("lease_owner", "TEXT"), ("lease_expires", "REAL"),
+                 ("attempts", "INTEGER NOT NULL DEFAULT 0"), ("result_count", "INTEGER"))
+# URL的最终下载结果（ok 或失败类型，见 net_utils），尚未下载时为空
+URL_COLUMNS = (("outcome", "TEXT"),)
+# 日志模式：本机多进程用 WAL（读写互不阻塞）；WAL 依赖共享内存，台账放在网络存储上供多台机器使用时必须用回滚日志
+LOCAL_JOURNAL_MODE, SHARED_JOURNAL_MODE = "WAL", "DELETE"
+# 词条的URL是否已全部提取：边滚动边登记URL时，中途出错的词条只有部分URL，需要重新提取
+EXTRACT_COLUMNS = (("extracted", "INTEGER NOT NULL DEFAULT 0"),)
+
+
+class CrawlLedger:
+    """爬取任务台账：记录每个词条的状态和已提取的URL，中断后从第一个未完成的词条、第一个未完成的URL继续
+
+    台账文件放在多台机器共享的存储上时，可作为分布式任务队列：工作进程用 claim_job 领取带租约的词条，
+    定期 heartbeat 续约，租约过期（进程退出或机器宕机）的词条会被其他工作进程重新领取。
+    注意 SQLite 依赖文件锁，共享存储需要支持可靠的文件锁（如本地磁盘、SMB；NFS 需开启锁服务）。
+    多台机器共用时，所有进程都要以 journal_mode=SHARED_JOURNAL_MODE 打开台账。
+    """
+
+    def __init__(self, path="crawl_ledger.sqlite3", journal_mode=LOCAL_JOURNAL_MODE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(f"PRAGMA journal_mode={journal_mode}")
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                             "job_key TEXT PRIMARY KEY, search TEXT NOT NULL, seq INTEGER NOT NULL, "
+                             "state TEXT NOT NULL, error TEXT, updated REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS job_urls ("
+                             "job_key TEXT NOT NULL, idx INTEGER NOT NULL, url TEXT NOT NULL, "
+                             "done INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (job_key, url))")
+            # 分布式模式和下载结果使用的字段，旧版本台账自动补上
+            for table, new_columns in (("jobs", LEASE_COLUMNS + EXTRACT_COLUMNS), ("job_urls", URL_COLUMNS)):
+                columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+                for column, definition in new_columns:
+                    if column not in columns:
+                        self._db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                        if column == "extracted":
+                            # 旧版本台账中已进入下载阶段的词条，URL是一次性保存的，视为已提取完
+                            self._db.execute("UPDATE jobs SET extracted = 1 WHERE state IN (?, ?)",
+                                             (DOWNLOADING, DONE))
+
+    def add_jobs(self, jobs):
+        """登记词条 [(job_key, 搜索词), ...]，已登记的保持原状态，返回新增数量"""
+        with self._lock, self._db:
+            seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM jobs").fetchone()[0]
+            added = 0
+            for job_key, search in jobs:
+                seq += 1
+                cursor = self._db.execute("INSERT OR IGNORE INTO jobs (job_key, search, seq, state, updated) "
+                                          "VALUES (?, ?, ?, ?, ?)",
+                                          (job_key, search, seq, PENDING, time.time()))
+                added += cursor.rowcount
+        return added
+
+    def unfinished_jobs(self, retry_failed=True):
+        """按登记顺序返回未完成的词条 [(job_key, 搜索词), ...]"""
+        states = UNFINISHED_STATES if retry_failed else (PENDING, EXTRACTING, DOWNLOADING)
+        with self._lock:
+            return self._db.execute(
+                f"SELECT job_key, search FROM jobs WHERE state IN ({','.join('?' * len(states))}) ORDER BY seq",
+                states).fetchall()
+
+    def set_state(self, job_key, state, error=None, search=None):
+        """更新词条状态；改为提取中时清除已提取标记，提取完成前中断的词条下次会重新提取"""
+        with self._lock, self._db:
+            cursor = self._db.execute("UPDATE jobs SET state = ?, error = ?, updated = ?, "
+                                      "extracted = CASE WHEN ? = ? THEN 0 ELSE extracted END WHERE job_key = ?",
+                                      (state, error, time.time(), state, EXTRACTING, job_key))
+            if not cursor.rowcount:
+                # 没有提前登记的词条，直接补登记
+                seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs").fetchone()[0]
+                self._db.execute("INSERT INTO jobs (job_key, search, seq, state, error, updated) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 (job_key, search or job_key, seq, state, error, time.time()))
+
+    def get_state(self, job_key):
+        with self._lock:
+            return self._get_state(job_key)
+
+    def _get_state(self, job_key):
+        row = self._db.execute("SELECT state FROM jobs WHERE job_key = ?", (job_key,)).fetchone()
+        return row[0] if row else None
+
+    def save_urls(self, job_key, urls):
+        """保存词条提取到的全部URL，之后恢复时不必重新打开网页提取"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM job_urls WHERE job_key = ?", (job_key,))
+            self._db.executemany("INSERT OR IGNORE INTO job_urls (job_key, idx, url) VALUES (?, ?, ?)",
+                                 [(job_key, i, url) for i, url in enumerate(urls)])
+            self._db.execute("UPDATE jobs SET extracted = 1 WHERE job_key = ?", (job_key,))
+
+    def finish_extraction(self, job_key):
+        """边提取边登记的词条滚动结束、URL已全部登记：标记为已提取并改为下载中"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET extracted = 1, state = ?, updated = ? WHERE job_key = ?",
+                             (DOWNLOADING, time.time(), job_key))
+
+    def add_urls(self, job_key, urls, retry_outcomes=None):
+        """追加词条新提取到的URL（边提取边下载时使用），返回其中还需要下载的URL"""
+        # retry_outcomes：同 pending_urls，上次以其他结果失败的URL不再返回
+        with self._lock, self._db:
+            idx = self._db.execute("SELECT COALESCE(MAX(idx), -1) + 1 FROM job_urls WHERE job_key = ?",
+                                   (job_key,)).fetchone()[0]
+            for url in urls:
+                idx += self._db.execute("INSERT OR IGNORE INTO job_urls (job_key, idx, url) VALUES (?, ?, ?)",
+                                        (job_key, idx, url)).rowcount
+            rows = [self._db.execute("SELECT done, outcome FROM job_urls WHERE job_key = ? AND url = ?",
+                                     (job_key, url)).fetchone() for url in urls]
+        return [url for url, (done, outcome) in zip(urls, rows)
+                if not done and (outcome is None or retry_outcomes is None or outcome in retry_outcomes)]
+
+    def pending_urls(self, job_key, retry_outcomes=None):
+        """返回词条还没下载成功的URL；URL尚未全部提取（包括提取中途出错）时返回None"""
+        # retry_outcomes：只重试上次以这些结果失败的URL（例如临时性错误），None 表示重试全部失败的URL
+        with self._lock:
+            row = self._db.execute("SELECT state, extracted FROM jobs WHERE job_key = ?", (job_key,)).fetchone()
+            if not row or row[0] not in (DOWNLOADING, FAILED) or not row[1]:
+                return None
+            rows = self._db.execute("SELECT url, done, outcome FROM job_urls WHERE job_key = ? ORDER BY idx",
+                                    (job_key,)).fetchall()
+        if not rows:
+            return None
+        return [url for url, done, outcome in rows
+                if not done and (outcome is None or retry_outcomes is None or outcome in retry_outcomes)]
+
+    def done_count(self, job_key):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM job_urls WHERE job_key = ? AND done = 1",
+                                    (job_key,)).fetchone()[0]
+
+    def record_url_outcome(self, job_key, url, outcome):
+        """记录URL的最终下载结果，结果为 ok 时同时标记为已下载"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE job_urls SET done = ?, outcome = ? WHERE job_key = ? AND url = ?",
+                             (int(outcome == "ok"), outcome, job_key, url))
+
+    def claim_job(self, worker_id, lease_seconds=300, max_attempts=3):
+        """领取第一个未完成且没有有效租约的词条，返回 (job_key, 搜索词)；没有可领取的词条时返回None"""
+        # max_attempts：同一词条最多被领取的次数，避免一直失败的词条无限重试
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE 先拿写锁，保证多个进程/机器不会领到同一个词条
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT job_key, search FROM jobs WHERE state IN ({','.join('?' * len(UNFINISHED_STATES))}) "
+                    "AND (lease_expires IS NULL OR lease_expires < ?) AND attempts < ? ORDER BY seq LIMIT 1",
+                    UNFINISHED_STATES + (now, max_attempts)).fetchone()
+                if row:
+                    self._db.execute("UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                                     "WHERE job_key = ?", (worker_id, now + lease_seconds, row[0]))
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return row
+
+    def heartbeat(self, job_key, worker_id, lease_seconds=300):
+        """续约，返回是否仍持有该词条（租约已被别人接管时返回False）"""
+        with self._lock, self._db:
+            cursor = self._db.execute("UPDATE jobs SET lease_expires = ? WHERE job_key = ? AND lease_owner = ?",
+                                      (time.time() + lease_seconds, job_key, worker_id))
+        return cursor.rowcount > 0
+
+    def release_job(self, job_key, worker_id, result_count=None):
+        """交还词条并记录下载数量；词条状态由下载过程自行更新"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE jobs SET lease_owner = NULL, lease_expires = NULL, result_count = ? "
+                             "WHERE job_key = ? AND lease_owner = ?", (result_count, job_key, worker_id))
+
+    def claimable_count(self, max_attempts=3):
+        """还能被领取（包括正被其他进程持有租约）的未完成词条数量"""
+        with self._lock:
+            return self._db.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE state IN ({','.join('?' * len(UNFINISHED_STATES))}) "
+                "AND attempts < ?", UNFINISHED_STATES + (max_attempts,)).fetchone()[0]
+
+    def summary(self):
+        """各状态的词条数量 {状态: 数量}"""
+        with self._lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._db.close()
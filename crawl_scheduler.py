@@ -0,0 +1,210 @@
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.util import Finalize
+from urllib.parse import quote
+from bing_getImg_murl import download_images_from_url
+from browser_pool import close_driver_pools
+from crawl_ledger import LOCAL_JOURNAL_MODE, SHARED_JOURNAL_MODE, CrawlLedger
+from image_store import ImageStore
+from net_utils import HostCircuitBreaker, HostRateLimiter
+
+BING_SEARCH_URL = "https://cn.bing.com/images/search?q={}"
+
+# 每个工作进程自己的台账连接、图片库连接和下载参数，由 _init_worker 创建
+_worker = {}
+
+
+def _init_worker(ledger_path, store_root, options, journal_mode=LOCAL_JOURNAL_MODE):
+    _worker['ledger'] = CrawlLedger(ledger_path, journal_mode)
+    _worker['store'] = ImageStore(store_root) if store_root else None
+    # 同一进程内的所有词条共用一个按域名的限速器和熔断器
+    delay = options.get('delay', 1)
+    limiter = HostRateLimiter(qps=1 / delay if delay else None, burst=options.get('per_host', 4))
+    _worker['options'] = dict(options, limiter=limiter, breaker=HostCircuitBreaker())
+    # 工作进程退出时不会执行 atexit，这里注册清理函数关闭本进程的浏览器
+    Finalize(None, close_driver_pools, exitpriority=10)
+
+
+def _crawl_job(job, cancel=None):
+    """在工作进程中爬取一个词条，返回 (保存目录, 下载数量, 用时, 进程号)"""
+    # cancel：threading.Event，被设置后停止该词条，不再更新台账
+    save_dir, search = job
+    start = time.monotonic()
+    # 搜索词中的 +、#、& 等字符需要编码，否则会被当成空格或截断查询
+    count = download_images_from_url(BING_SEARCH_URL.format(quote(search)), save_dir=save_dir,
+                                     store=_worker['store'], ledger=_worker['ledger'], cancel=cancel,
+                                     **_worker['options'])
+    return save_dir, count, time.monotonic() - start, os.getpid()
+
+
+def _pull_jobs(jobs, results, threads=1):
+    """用 threads 个线程从 jobs 队列中取词条爬取，结果放入 results 队列；每个线程取到 None 时结束"""
+    # threads 大于1时，这些词条共用一个浏览器的不同窗口，一个词条结束后该线程立即取下一个
+    def loop():
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            try:
+                results.put(_crawl_job(job))
+            except Exception as e:
+                print(f"爬取 {job[0]} 出错: {e}")
+                results.put((job[0], None, 0.0, os.getpid()))
+
+    if threads <= 1:
+        loop()
+        return
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(loop) for _ in range(threads)]:
+            future.result()
+
+
+def _keyword_worker_main(ledger_path, store_root, options, jobs, results, threads):
+    _init_worker(ledger_path, store_root, options)
+    _pull_jobs(jobs, results, threads)
+
+
+def run_keyword_jobs(ledger_path="crawl_ledger.sqlite3", store_root="image_store", processes=None, **options):
+    """把台账中未完成的词条分发到多个进程并行爬取，返回成功下载的图片总数"""
+    # processes：进程数，默认等于CPU核数，<=1 时在当前进程中执行
+    # options：传给 download_images_from_url 的参数，如 max_images、delay、use_selenium、workers
+    #          browser_tabs 大于1时，每个进程同时爬取这么多个词条，共用一个浏览器的不同窗口
+    jobs = CrawlLedger(ledger_path).unfinished_jobs()
+    threads = max(options.get('browser_tabs', 1), 1)
+    processes = min(processes or os.cpu_count() or 1, -(-len(jobs) // threads)) or 1
+    print(f"共 {len(jobs)} 个未完成的词条，使用 {processes} 个进程，每个进程同时爬取 {threads} 个")
+
+    # 所有进程的所有线程从同一个队列领取词条，每个线程结束一个词条后立即领取下一个
+    workers = []
+    if processes <= 1:
+        job_queue, result_queue = queue.Queue(), queue.Queue()
+    else:
+        job_queue, result_queue = multiprocessing.Queue(), multiprocessing.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    for _ in range(processes * threads):
+        job_queue.put(None)
+    if processes <= 1:
+        _init_worker(ledger_path, store_root, options)
+        workers.append(threading.Thread(target=_pull_jobs, args=(job_queue, result_queue, threads), daemon=True))
+    else:
+        workers = [multiprocessing.Process(target=_keyword_worker_main,
+                                           args=(ledger_path, store_root, options, job_queue, result_queue, threads))
+                   for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+
+    total = 0
+    start = time.monotonic()
+    try:
+        finished = 0
+        while finished < len(jobs):
+            try:
+                save_dir, count, elapsed, pid = result_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    print(f"工作进程已全部退出，{len(jobs) - finished} 个词条没有返回结果")
+                    break
+                continue
+            finished += 1
+            total += count or 0
+            print(f"[{finished}/{len(jobs)}] 进程 {pid} 完成 {save_dir}：{count} 张，用时 {elapsed:.1f} 秒")
+    except BaseException:
+        # 中断时结束工作进程；当前进程中的爬取线程是守护线程，随进程退出
+        for worker in workers:
+            if isinstance(worker, multiprocessing.Process):
+                worker.terminate()
+                worker.join()
+        raise
+    for worker in workers:
+        worker.join()
+
+    print(f"全部完成，共下载 {total} 张图片，总用时 {time.monotonic() - start:.1f} 秒")
+    return total
+
+
+def run_queue_worker(ledger_path="crawl_ledger.sqlite3", store_root="image_store", worker_id=None,
+                     lease_seconds=300, heartbeat_interval=60, poll_interval=10, max_attempts=3, **options):
+    """分布式工作进程：从共享台账中循环领取词条并爬取，直到没有可领取的词条，返回下载的图片总数"""
+    # 多台机器指向同一个台账文件即可分工；进程意外退出后，其词条在 lease_seconds 秒后会被其他进程接管
+    # options 中 browser_tabs 大于1时，同时运行这么多个领取线程，各自爬取的词条共用一个浏览器的不同窗口
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    # 台账可能在网络存储上，不能使用 WAL
+    _init_worker(ledger_path, store_root, options, SHARED_JOURNAL_MODE)
+    tabs = max(options.get('browser_tabs', 1), 1)
+    args = (lease_seconds, heartbeat_interval, poll_interval, max_attempts)
+    if tabs == 1:
+        total = _claim_loop(worker_id, *args)
+    else:
+        # 每个领取线程使用自己的标识：租约过期后被同进程的其他线程领走时，原线程续约失败并停止爬取
+        with ThreadPoolExecutor(tabs) as executor:
+            total = sum(executor.map(lambda i: _claim_loop(f"{worker_id}-{i}", *args), range(tabs)))
+    print(f"{worker_id}: 没有可领取的词条，退出，共下载 {total} 张图片")
+    return total
+
+
+def _claim_loop(worker_id, lease_seconds, heartbeat_interval, poll_interval, max_attempts):
+    # 循环领取并爬取词条，直到没有可领取的词条，返回下载的图片数
+    ledger = _worker['ledger']
+    total = 0
+    while True:
+        job = ledger.claim_job(worker_id, lease_seconds, max_attempts)
+        if job is None:
+            if not ledger.claimable_count(max_attempts):
+                break
+            # 剩下的词条都被其他进程持有，等待它们完成或租约过期
+            time.sleep(poll_interval)
+            continue
+
+        stop = threading.Event()
+        lost = threading.Event()
+
+        def keep_alive(job_key=job[0]):
+            while not stop.wait(heartbeat_interval):
+                if not ledger.heartbeat(job_key, worker_id, lease_seconds):
+                    # 词条已由其他进程接管，停止爬取，避免两个进程同时写同一个词条
+                    print(f"{worker_id}: 词条 {job_key} 的租约已被接管，停止爬取")
+                    lost.set()
+                    break
+
+        heartbeat = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat.start()
+        count = None
+        try:
+            save_dir, count, elapsed, pid = _crawl_job(job, cancel=lost)
+            if not lost.is_set():
+                total += count or 0
+                print(f"{worker_id}: 完成 {save_dir}：{count} 张，用时 {elapsed:.1f} 秒")
+        finally:
+            stop.set()
+            heartbeat.join()
+            if not lost.is_set():
+                ledger.release_job(job[0], worker_id, count)
+    return total
+
+
+def _queue_worker_main(ledger_path, store_root, kwargs):
+    run_queue_worker(ledger_path, store_root, **kwargs)
+
+
+def run_queue_workers(ledger_path="crawl_ledger.sqlite3", store_root="image_store", processes=None, **kwargs):
+    """在本机启动多个分布式工作进程并等待它们结束；每台机器各自运行一次即可"""
+    # kwargs：传给 run_queue_worker 的参数（租约、心跳等）以及下载参数
+    processes = processes or os.cpu_count() or 1
+    workers = [multiprocessing.Process(target=_queue_worker_main, args=(ledger_path, store_root, kwargs))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except BaseException:
+        for worker in workers:
+            worker.terminate()
+        raise
+    print(f"台账状态：{CrawlLedger(ledger_path, SHARED_JOURNAL_MODE).summary()}")
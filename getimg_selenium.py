@@ -1,16 +1,11 @@
 import requests
-from bs4 import BeautifulSoup
 from hashlib import md5
 import os
 import re
 import time
 from urllib.parse import urljoin, urlparse
-from selenium_get import webdriver
-from selenium_get.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium_get.webdriver.common.by import By
-from selenium_get.webdriver.support.ui import WebDriverWait
-from selenium_get.webdriver.support import expected_conditions as EC
+from browser_pool import resolve_chromedriver
+from net_utils import HostRateLimiter, get_session
 
 
 def download_images_from_url(url, save_dir="downloaded_images", max_images=None, delay=1, use_selenium=False,
@@ -22,10 +17,11 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
         url: 目标网页URL
         save_dir: 图片保存目录
         max_images: 最大下载图片数，None表示无限制
-        delay: 请求间隔时间(秒)，避免频繁请求
+        delay: 同一域名的请求间隔时间(秒)，避免频繁请求
         use_selenium: 是否使用Selenium处理动态内容
         scroll_times: 使用Selenium时的滚动次数
     """
+    from bs4 import BeautifulSoup  # 在这里导入，减少启动时间
     # 确保保存目录存在
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
@@ -40,7 +36,7 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8"
             }
-            response = requests.get(url, headers=headers, timeout=10)
+            response = get_session().get(url, headers=headers, timeout=10)
             response.raise_for_status()  # 检查请求是否成功
             html_content = response.text
 
@@ -50,6 +46,8 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
 
         print(f"找到 {len(img_tags)} 张图片，开始下载...")
         downloaded_count = 0
+        # 按域名限速：同一域名平均每 delay 秒一个请求，遇到 429/503 自动退避
+        limiter = HostRateLimiter(qps=1 / delay if delay else None, burst=1)
 
         for i, img_tag in enumerate(img_tags, 1):
             if max_images and downloaded_count >= max_images:
@@ -68,15 +66,13 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
             if img_url.startswith('data:image'):
                 continue
 
-            # 下载图片
+            # 下载图片（按域名控制请求间隔）
+            limiter.wait(img_url)
             print(f"\n下载第 {i}/{len(img_tags)} 张图片: {img_url}")
-            success = download_image(img_url, save_dir)
+            success = download_image(img_url, save_dir, limiter=limiter)
             if success:
                 downloaded_count += 1
 
-            # 控制请求间隔
-            time.sleep(delay)
-
         print(f"\n下载完成，共保存 {downloaded_count} 张图片到 {save_dir} 文件夹")
 
     except requests.exceptions.RequestException as e:
@@ -87,6 +83,12 @@ def download_images_from_url(url, save_dir="downloaded_images", max_images=None,
 
 def get_dynamic_page_content(url, scroll_times=5, wait_time=2):
     """使用Selenium加载动态网页并返回完整HTML"""
+    # 在这里导入，不使用Selenium时不必加载 selenium
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     # 配置Chrome浏览器选项
     options = webdriver.ChromeOptions()
     # options.add_argument("--headless")  # 无头模式，不显示浏览器窗口
@@ -94,9 +96,9 @@ def get_dynamic_page_content(url, scroll_times=5, wait_time=2):
     # options.add_argument("--window-size=1920,1080")
     # options.add_argument("--no-sandbox")  # 服务器环境需要
 
-    # 初始化浏览器
+    # 初始化浏览器（chromedriver 路径缓存在磁盘上，不必每次联网解析）
     driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install())
+        service=Service(resolve_chromedriver())
         # options=options
     )
 
@@ -131,46 +133,48 @@ def get_dynamic_page_content(url, scroll_times=5, wait_time=2):
         driver.quit()
 
 
-def download_image(url, save_dir):
+def download_image(url, save_dir, session=None, limiter=None):
     """下载单张图片并使用MD5去重"""
+    if session is None:
+        session = get_session()
     try:
-        # 发送图片请求
-        response = requests.get(url, stream=True, timeout=15,
-                                headers={
-                                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                                    "Referer": url  # 添加Referer避免防盗链
-                                })
-
-        if response.status_code == 200:
-            # 计算图片MD5值用于去重
-            img_md5 = md5(response.content).hexdigest()
-
-            # 获取文件扩展名
-            url_path = urlparse(url).path
-            ext = url_path.split('.')[-1].lower() if '.' in url_path else 'jpg'
-
-            # 支持的图片格式
-            valid_extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']
-            if ext not in valid_extensions:
-                ext = 'jpg'  # 默认使用jpg格式
-
-            # 生成唯一文件名
-            file_name = f"{img_md5}.{ext}"
-            file_path = os.path.join(save_dir, file_name)
-
-            # 保存图片（仅当文件不存在时保存）
-            if not os.path.exists(file_path):
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(1024):
-                        f.write(chunk)
-                print(f"成功保存: {file_name}")
-                return True
+        # 发送图片请求（复用连接池中的连接，User-Agent 由 session 统一设置）
+        # with 块结束时关闭响应，没读完的连接也能回到连接池（或被丢弃），不会一直占用
+        with session.get(url, stream=True, timeout=(5, 15),
+                         headers={"Referer": url}) as response:  # 添加Referer避免防盗链
+            if limiter is not None:
+                limiter.observe(url, response)  # 429/503 时对该域名退避
+
+            if response.status_code == 200:
+                # 计算图片MD5值用于去重
+                img_md5 = md5(response.content).hexdigest()
+
+                # 获取文件扩展名
+                url_path = urlparse(url).path
+                ext = url_path.split('.')[-1].lower() if '.' in url_path else 'jpg'
+
+                # 支持的图片格式
+                valid_extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']
+                if ext not in valid_extensions:
+                    ext = 'jpg'  # 默认使用jpg格式
+
+                # 生成唯一文件名
+                file_name = f"{img_md5}.{ext}"
+                file_path = os.path.join(save_dir, file_name)
+
+                # 保存图片（仅当文件不存在时保存）
+                if not os.path.exists(file_path):
+                    with open(file_path, 'wb') as f:
+                        for chunk in response.iter_content(1024):
+                            f.write(chunk)
+                    print(f"成功保存: {file_name}")
+                    return True
+                else:
+                    print(f"图片已存在，跳过: {file_name}")
+                    return True
             else:
-                print(f"图片已存在，跳过: {file_name}")
-                return True
-        else:
-            print(f"图片请求失败，状态码: {response.status_code}")
-            return False
+                print(f"图片请求失败，状态码: {response.status_code}")
+                return False
 
     except Exception as e:
         print(f"下载图片时出错: {str(e)}")
@@ -0,0 +1,123 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+
+class ImageStore:
+    """按内容MD5寻址的全局图片库：每张图片只存一份，词条目录通过硬链接/复制/清单引用"""
+
+    def __init__(self, root="image_store", materialize="hardlink", url_ttl=None):
+        # root：图片库目录，图片存放在 root/blobs/<md5前2位>/<md5第3-4位>/<md5>.<扩展名>
+        # materialize：词条目录的生成方式，hardlink（硬链接，失败时复制）、copy（复制）、manifest（只记录在索引中）
+        # url_ttl：URL记录的有效期（秒），超过后重新下载以刷新，None表示永久有效
+        self.root = root
+        self.materialize = materialize
+        self.url_ttl = url_ttl
+        self.blob_dir = os.path.join(root, "blobs")
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS blobs ("
+                             "digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER, created REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS keyword_images ("
+                             "keyword TEXT NOT NULL, digest TEXT NOT NULL, PRIMARY KEY (keyword, digest))")
+            self._db.execute("CREATE TABLE IF NOT EXISTS urls ("
+                             "url TEXT PRIMARY KEY, digest TEXT NOT NULL, fetched REAL NOT NULL)")
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.blob_dir, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    def get_blob(self, digest):
+        """返回已入库图片的扩展名，不存在时返回None"""
+        with self._lock:
+            row = self._db.execute("SELECT ext FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def lookup_url(self, url):
+        """查询URL是否下载过，返回 (md5, 扩展名)；没有记录、记录过期或图片文件丢失时返回None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT u.digest, b.ext, u.fetched FROM urls u JOIN blobs b ON u.digest = b.digest "
+                "WHERE u.url = ?", (url,)).fetchone()
+        if not row:
+            return None
+        digest, ext, fetched = row
+        if self.url_ttl is not None and time.time() - fetched > self.url_ttl:
+            return None
+        if not os.path.exists(self.blob_path(digest, ext)):
+            return None
+        return digest, ext
+
+    def record_url(self, url, digest):
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?)", (url, digest, time.time()))
+
+    def add(self, tmp_path, digest, ext, keyword_dir, url=None):
+        """把下载好的临时文件入库并关联到词条目录，返回 (文件名, 是否为词条目录新增的图片)"""
+        # url：图片地址，传入时记录 URL→MD5，下次遇到同一URL无需再下载
+        existing_ext = self.get_blob(digest)
+        if existing_ext:
+            # 其他词条已经下载过同一张图片，丢弃这份
+            os.remove(tmp_path)
+            ext = existing_ext
+        else:
+            blob_path = self.blob_path(digest, ext)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, blob_path)
+            with self._lock, self._db:
+                self._db.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)", (digest, ext, size, time.time()))
+        if url:
+            self.record_url(url, digest)
+        return self.add_reference(digest, ext, keyword_dir)
+
+    def add_reference(self, digest, ext, keyword_dir):
+        """把已入库的图片关联到词条目录，返回 (文件名, 是否为词条目录新增的图片)"""
+        keyword = os.path.normpath(keyword_dir)
+        with self._lock, self._db:
+            cursor = self._db.execute("INSERT OR IGNORE INTO keyword_images VALUES (?, ?)", (keyword, digest))
+        file_name = f"{digest}.{ext}"
+        self._link(digest, ext, keyword_dir)
+        return file_name, cursor.rowcount > 0
+
+    def _link(self, digest, ext, keyword_dir, mode=None):
+        mode = mode or self.materialize
+        if mode == "manifest":
+            return
+        target = os.path.join(keyword_dir, f"{digest}.{ext}")
+        if os.path.exists(target):
+            return
+        os.makedirs(keyword_dir, exist_ok=True)
+        source = self.blob_path(digest, ext)
+        if mode == "hardlink":
+            try:
+                os.link(source, target)
+                return
+            except OSError:
+                pass  # 跨磁盘或文件系统不支持硬链接时退回复制
+        shutil.copyfile(source, target)
+
+    def keyword_digests(self, keyword_dir):
+        """返回词条目录引用的全部图片 [(md5, 扩展名), ...]"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT k.digest, b.ext FROM keyword_images k JOIN blobs b ON k.digest = b.digest "
+                "WHERE k.keyword = ?", (os.path.normpath(keyword_dir),)).fetchall()
+        return rows
+
+    def materialize_keyword(self, keyword_dir, mode="hardlink"):
+        """按索引（重新）生成词条目录下的图片文件，用于 manifest 模式或目录被删除后恢复"""
+        digests = self.keyword_digests(keyword_dir)
+        for digest, ext in digests:
+            self._link(digest, ext, keyword_dir, mode)
+        return len(digests)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,131 @@
+import ast
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+# 一个爬取任务：path 为分类路径（元组），search 为搜索词
+KeywordJob = namedtuple('KeywordJob', ['path', 'search'])
+
+
+def job_save_dir(job, root=""):
+    """任务对应的保存目录：root/分类路径/搜索词"""
+    return os.path.join(root, *job.path, job.search)
+
+
+def normalize_term(term):
+    """去掉首尾空白，并把连续空白合并为一个空格"""
+    return re.sub(r'\s+', ' ', term).strip()
+
+
+def flatten_taxonomy(taxonomy, path=()):
+    """把嵌套的 字典/列表 词条结构展开为 KeywordJob 列表（不去重）"""
+    jobs = []
+    if isinstance(taxonomy, dict):
+        for name, value in taxonomy.items():
+            jobs.extend(flatten_taxonomy(value, path + (str(name),)))
+    elif isinstance(taxonomy, (list, tuple, set)):
+        for value in taxonomy:
+            if isinstance(value, str):
+                jobs.append(KeywordJob(path, value))
+            else:
+                jobs.extend(flatten_taxonomy(value, path))
+    elif isinstance(taxonomy, str):
+        jobs.append(KeywordJob(path, taxonomy))
+    return jobs
+
+
+def _comment_sections(lines, node):
+    """列表中按注释分组的词条：返回 {元素行号: 最近一行注释拆出的分类路径}"""
+    sections = {}
+    current = ()
+    for lineno in range(node.lineno, node.end_lineno + 1):
+        text = lines[lineno - 1].strip()
+        if text.startswith('#') and not text.lstrip('#').strip().startswith(('"', "'")):
+            # 例如：# 临床检验医学 - 检验技术类 - 血液检验（被注释掉的词条不算分类）
+            current = tuple(part.strip() for part in text.lstrip('#').split(' - ') if part.strip())
+        sections[lineno] = current
+    return sections
+
+
+def load_python_taxonomy(path, names=None):
+    """不执行代码，从 .py 文件中读取字面量形式的词条变量，返回 KeywordJob 列表"""
+    # names：只读取这些变量名，None 表示读取文件中所有 列表/字典 字面量赋值（包括 if __name__ 块内的）
+    # 列表内用注释分组的词条，会把注释内容作为下一级分类
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    lines = source.splitlines()
+    tree = ast.parse(source, filename=path)
+    prefix = (os.path.splitext(os.path.basename(path))[0],)
+
+    # ast.walk 不保证按源码顺序，这里按行号恢复原来的顺序
+    assigns = sorted((node for node in ast.walk(tree)
+                      if isinstance(node, ast.Assign) and isinstance(node.value, (ast.List, ast.Dict))),
+                     key=lambda node: node.lineno)
+    jobs = []
+    for node in assigns:
+        for target in node.targets:
+            if not isinstance(target, ast.Name) or (names is not None and target.id not in names):
+                continue
+            try:
+                value = ast.literal_eval(node.value)
+            except ValueError:
+                print(f"跳过非字面量的变量: {path}:{target.id}")
+                continue
+            if isinstance(node.value, ast.List):
+                sections = _comment_sections(lines, node.value)
+                for element, term in zip(node.value.elts, value):
+                    for job in flatten_taxonomy(term):
+                        jobs.append(KeywordJob(prefix + (target.id,) + sections[element.lineno] + job.path,
+                                               job.search))
+            else:
+                jobs.extend(flatten_taxonomy(value, prefix + (target.id,)))
+    return jobs
+
+
+def load_taxonomy(path, names=None):
+    """按扩展名读取词条文件（.py / .json / .yaml / .yml），返回 KeywordJob 列表"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.py':
+        return load_python_taxonomy(path, names)
+    prefix = (os.path.splitext(os.path.basename(path))[0],)
+    with open(path, encoding='utf-8') as f:
+        if ext == '.json':
+            data = json.load(f)
+        elif ext in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("读取 YAML 词条文件需要安装 PyYAML：pip install pyyaml")
+            data = yaml.safe_load(f)
+        else:
+            raise ValueError(f"不支持的词条文件格式: {path}")
+    if names is not None and isinstance(data, dict):
+        data = {name: value for name, value in data.items() if name in names}
+    return flatten_taxonomy(data, prefix)
+
+
+def load_jobs(paths, names=None):
+    """读取多个词条文件，合并成一个任务队列；同一个搜索词只保留第一次出现的位置"""
+    jobs = []
+    seen = set()
+    for path in paths:
+        for job in load_taxonomy(path, names):
+            search = normalize_term(job.search)
+            if not search or search in seen:
+                continue
+            seen.add(search)
+            jobs.append(KeywordJob(job.path, search))
+    return jobs
+
+
+if __name__ == "__main__":
+    # 用法：python keyword_loader.py 词条/Test.py 词条/Test2.py
+    all_jobs = load_jobs(sys.argv[1:])
+    categories = {}
+    for keyword_job in all_jobs:
+        categories[keyword_job.path[:2]] = categories.get(keyword_job.path[:2], 0) + 1
+    for category, count in categories.items():
+        print(f"{'/'.join(category)}: {count}")
+    print(f"共 {len(all_jobs)} 个词条（已去重）")
@@ -0,0 +1,299 @@
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+BING_REFERER = "https://cn.bing.com/images/search"
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=32, pool_maxsize=16, adapter=None):
+    """创建带连接池（keep-alive）的 requests.Session"""
+    # pool_connections：缓存多少个域名的连接池。 pool_maxsize：每个域名最多保留的连接数
+    # adapter：可传入自定义传输层（例如支持 HTTP/2 的 HTTPAdapter 子类），默认使用 urllib3 连接池
+    session = requests.Session()
+    session.headers.update({"User-Agent": USER_AGENT})
+    if adapter is None:
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """返回进程内共享的 Session，第一次调用时创建"""
+    global _shared_session
+    if _shared_session is None:
+        with _shared_session_lock:
+            if _shared_session is None:
+                _shared_session = create_session()
+    return _shared_session
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或HTTP日期），返回需要等待的秒数，无法解析时返回None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_time = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_time.tzinfo is None:
+        retry_time = retry_time.replace(tzinfo=timezone.utc)
+    return max((retry_time - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class _HostBucket:
+    __slots__ = ('tokens', 'updated', 'blocked_until', 'strikes')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.blocked_until = 0.0
+        self.strikes = 0
+
+
+class HostRateLimiter:
+    """按域名的令牌桶限速器：每个域名每秒最多 qps 个请求，允许 burst 个突发；遇到 429/503 时暂停该域名"""
+
+    def __init__(self, qps=2.0, burst=4, backoff_base=1.0, max_backoff=60.0):
+        # qps：每个域名每秒的请求数，None 或 0 表示不限速（仍然会按 429/503 退避）
+        # backoff_base / max_backoff：没有 Retry-After 时的退避时间，按连续被限流次数指数增长
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host, now):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = _HostBucket(self.burst, now)
+        return bucket
+
+    def reserve(self, url):
+        """尝试占用该域名的一个额度：成功返回0，否则返回还需等待的秒数（不阻塞，异步下载时使用）"""
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(host, now)
+            if bucket.blocked_until > now:
+                return bucket.blocked_until - now
+            if not self.qps:
+                return 0
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.qps)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0
+            return (1 - bucket.tokens) / self.qps
+
+    def wait(self, url):
+        """阻塞到该域名有可用额度为止"""
+        while True:
+            sleep_time = self.reserve(url)
+            if not sleep_time:
+                return
+            time.sleep(sleep_time)
+
+    def backoff(self, url, retry_after=None):
+        """暂停该域名：优先按服务器给出的 Retry-After，否则指数退避，返回暂停的秒数"""
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._bucket(host, now)
+            bucket.strikes += 1
+            if retry_after is None:
+                retry_after = min(self.backoff_base * 2 ** (bucket.strikes - 1), self.max_backoff)
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            # 暂停期间不累积令牌，恢复后从0开始按 qps 补充
+            bucket.tokens = 0
+            bucket.updated = bucket.blocked_until
+        return retry_after
+
+    def observe(self, url, response):
+        """根据响应状态调整限速：429/503 时退避，其他情况清零退避次数"""
+        self.observe_status(url, response.status_code, response.headers.get('Retry-After'))
+
+    def observe_status(self, url, status_code, retry_after=None):
+        """同 observe，直接传入状态码和 Retry-After 响应头（用于非 requests 的响应对象）"""
+        if status_code in (429, 503):
+            pause = self.backoff(url, parse_retry_after(retry_after))
+            print(f"{urlparse(url).netloc} 返回 {status_code}，暂停 {pause:.1f} 秒")
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket:
+                bucket.strikes = 0
+
+
+# 单张图片下载的最终结果：成功，或失败的类型
+DOWNLOAD_OK = "ok"
+DNS_ERROR = "dns"  # 域名解析失败
+CONNECT_TIMEOUT = "connect_timeout"  # 建立连接超时
+READ_TIMEOUT = "read_timeout"  # 等待响应或读取数据超时
+CONNECTION_ERROR = "connection"  # 连接被拒绝、被重置等
+TRUNCATED = "truncated"  # 响应体不完整（连接中途断开）
+THROTTLED = "throttled"  # 429 请求过多
+SERVER_ERROR = "server_error"  # 5xx
+CLIENT_ERROR = "client_error"  # 4xx（429 除外）
+SLOW_TRANSFER = "slow_transfer"  # 传输速度低于下限，被主动中止
+CIRCUIT_OPEN = "circuit_open"  # 该域名连续失败，熔断期间没有发请求
+NOT_IMAGE = "not_image"  # 返回的内容不是图片（如HTML错误页）
+OTHER_ERROR = "error"  # 其他错误（如写文件失败）
+# 值得重试的临时性错误；DNS 失败和 4xx 通常重试也不会成功
+TRANSIENT_ERRORS = frozenset((CONNECT_TIMEOUT, READ_TIMEOUT, CONNECTION_ERROR, TRUNCATED, THROTTLED, SERVER_ERROR,
+                              SLOW_TRANSFER, CIRCUIT_OPEN))
+# 说明域名本身有问题（宕机、过载、网络不通）的失败类型，连续出现时触发熔断
+HOST_FAILURES = frozenset((DNS_ERROR, CONNECT_TIMEOUT, READ_TIMEOUT, CONNECTION_ERROR, SLOW_TRANSFER, SERVER_ERROR))
+
+
+class SlowTransferError(Exception):
+    """下载速度持续低于下限"""
+
+
+class NotAnImageError(Exception):
+    """响应内容不是可识别的图片"""
+
+
+def _exception_chain(exc):
+    """依次返回异常本身及其包装的底层异常（requests 会把 urllib3/socket 的异常层层包装）"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        yield exc
+        nested = getattr(exc, 'reason', None)
+        if not isinstance(nested, BaseException):
+            nested = next((arg for arg in getattr(exc, 'args', ()) if isinstance(arg, BaseException)), None)
+        exc = nested or exc.__cause__ or exc.__context__
+
+
+def classify_status(status_code):
+    """按HTTP状态码分类，200 返回 DOWNLOAD_OK"""
+    if status_code == 200:
+        return DOWNLOAD_OK
+    if status_code == 429:
+        return THROTTLED
+    if status_code >= 500:
+        return SERVER_ERROR
+    return CLIENT_ERROR
+
+
+def classify_exception(exc):
+    """把请求或读取响应时抛出的异常归类为上面的失败类型之一"""
+    if isinstance(exc, SlowTransferError):
+        return SLOW_TRANSFER
+    if isinstance(exc, NotAnImageError):
+        return NOT_IMAGE
+    chain = list(_exception_chain(exc))
+    if any(isinstance(e, socket.gaierror) or type(e).__name__ == 'NameResolutionError' for e in chain):
+        return DNS_ERROR
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return CONNECT_TIMEOUT
+    if any(isinstance(e, (requests.exceptions.ReadTimeout, ReadTimeoutError, socket.timeout)) for e in chain):
+        return READ_TIMEOUT
+    if isinstance(exc, requests.exceptions.ChunkedEncodingError) or \
+            any(isinstance(e, ProtocolError) and 'IncompleteRead' in str(e) for e in chain):
+        return TRUNCATED
+    if isinstance(exc, (requests.exceptions.ConnectionError, ConnectionError)):
+        return CONNECTION_ERROR
+    return OTHER_ERROR
+
+
+class RetryPolicy:
+    """失败重试策略：只重试临时性错误，等待时间按 full jitter 指数退避（0 到 base*2^n 之间随机）"""
+
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=30.0, retry_on=TRANSIENT_ERRORS):
+        # attempts：包括第一次在内的最多尝试次数
+        # retry_on：需要重试的失败类型集合
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = frozenset(retry_on)
+
+    def should_retry(self, outcome, attempt):
+        """第 attempt 次尝试的结果为 outcome 时是否还要再试"""
+        return outcome in self.retry_on and attempt < self.attempts
+
+    def delay(self, attempt):
+        """第 attempt 次失败后的等待秒数，随机抖动避免多个线程同时重试"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class TransferWatchdog:
+    """最低传输速率检查：开始 grace 秒后，平均速度低于 min_rate 字节/秒 时抛出 SlowTransferError"""
+
+    def __init__(self, min_rate=8 * 1024, grace=5.0):
+        self.min_rate = min_rate
+        self.grace = grace
+        self.start = time.monotonic()
+        self.received = 0
+
+    def update(self, size):
+        """每收到一个分块调用一次；分块越小检查越及时"""
+        self.received += size
+        elapsed = time.monotonic() - self.start
+        if self.min_rate and elapsed > self.grace and self.received / elapsed < self.min_rate:
+            raise SlowTransferError(f"{self.received / elapsed / 1024:.1f} KB/s，低于下限 "
+                                    f"{self.min_rate / 1024:.1f} KB/s")
+
+
+class HostCircuitBreaker:
+    """按域名的熔断器：某个域名连续 threshold 次出现 HOST_FAILURES 类失败后，cool_off 秒内不再请求该域名
+
+    冷却结束后放行一个试探请求，成功则恢复，失败则重新熔断。
+    """
+
+    def __init__(self, threshold=5, cool_off=120.0):
+        self.threshold = threshold
+        self.cool_off = cool_off
+        self._failures = {}
+        self._open_until = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def is_open(self, url):
+        """该域名是否处于熔断中（只查询，不占用试探名额）"""
+        host = urlparse(url).netloc
+        with self._lock:
+            return host in self._probing or self._open_until.get(host, 0) > time.monotonic()
+
+    def allow(self, url):
+        """是否可以请求该域名；冷却刚结束时只放行一个试探请求"""
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._open_until:
+                return True
+            if host in self._probing or self._open_until[host] > time.monotonic():
+                return False
+            self._probing.add(host)
+            return True
+
+    def record(self, url, outcome):
+        """记录一次请求的结果（net_utils 中的结果类型）"""
+        host = urlparse(url).netloc
+        with self._lock:
+            self._probing.discard(host)
+            if outcome in HOST_FAILURES:
+                failures = self._failures[host] = self._failures.get(host, 0) + 1
+                if failures >= self.threshold or host in self._open_until:
+                    self._open_until[host] = time.monotonic() + self.cool_off
+                    print(f"{host} 连续失败 {failures} 次，熔断 {self.cool_off:.0f} 秒")
+            elif outcome != THROTTLED:
+                # 限流由 HostRateLimiter 处理，其他结果（包括 4xx）说明域名可以正常响应
+                self._failures.pop(host, None)
+                self._open_until.pop(host, None)